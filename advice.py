@@ -0,0 +1,95 @@
+"""Avisos e recomendações da Visão geral.
+
+As regras comparam o mês inteiro (resumo mensal) com as metas do usuário:
+poupança mínima e teto de cada categoria de despesa, como fração da receita
+do mês. Metas não configuradas usam os padrões abaixo. O resultado de cada
+usuário/mês fica gravado no banco (`avisos_mes`) com a versão do mês usada no
+cálculo e só é refeito quando um lançamento daquele mês muda (ou as metas).
+"""
+import json
+import sqlite3
+from dataclasses import asdict, dataclass
+from typing import Mapping, Optional
+
+import db
+
+# Percentuais recomendados (exemplos comuns): teto da categoria sobre a renda do mês
+DEFAULT_TARGETS = {
+    "Moradia": 0.30,
+    "Alimentação": 0.15,
+    "Transporte": 0.15,
+    "Lazer": 0.10,
+    "Dívidas/Crédito": 0.20,
+}
+# Regra: poupar pelo menos 20% da renda
+DEFAULT_SAVE_TARGET = 0.20
+# Chave da meta de poupança na tabela `metas`
+SAVE_KEY = ""
+
+
+@dataclass(frozen=True)
+class Verdict:
+    nivel: str      # 'ok', 'alerta' ou 'info'
+    mensagem: str
+
+
+def evaluate(
+    receitas: float,
+    despesas: float,
+    despesas_por_categoria: Mapping[str, float],
+    targets: Mapping[str, float],
+    save_target: float,
+) -> list[Verdict]:
+    """Avisos de um mês a partir dos totais (em reais) e das metas."""
+    avisos = []
+    saldo = receitas - despesas
+    if receitas > 0:
+        if saldo >= receitas * save_target:
+            avisos.append(Verdict("ok", f"Poupança/meta: OK — economia de {saldo/receitas*100:.1f}% (alvo: {save_target*100:.0f}%)"))
+        else:
+            avisos.append(Verdict("alerta", f"Poupança/meta: Abaixo do recomendado — {saldo/receitas*100:.1f}% (alvo: {save_target*100:.0f}%)"))
+    else:
+        avisos.append(Verdict("info", "Sem receitas no mês para avaliar poupança/meta."))
+
+    if despesas_por_categoria and receitas > 0:
+        for cat, pct in targets.items():
+            share = float(despesas_por_categoria.get(cat, 0.0)) / receitas
+            if share <= pct:
+                avisos.append(Verdict("ok", f"{cat}: {share*100:.1f}% da renda (alvo <= {pct*100:.0f}%)"))
+            else:
+                avisos.append(Verdict("alerta", f"{cat}: {share*100:.1f}% da renda — acima do recomendado (alvo <= {pct*100:.0f}%)"))
+    elif receitas == 0 and despesas > 0:
+        avisos.append(Verdict("alerta", "Há despesas, mas nenhuma receita registrada no mês corrente."))
+    return avisos
+
+
+def get_targets(conn: sqlite3.Connection, user_id: Optional[str]) -> tuple[dict[str, float], float]:
+    """(tetos por categoria, poupança mínima) do usuário, com os padrões onde não há meta."""
+    gravadas = db.get_targets(conn, user_id)
+    save_target = gravadas.pop(SAVE_KEY, DEFAULT_SAVE_TARGET)
+    return {**DEFAULT_TARGETS, **gravadas}, save_target
+
+
+def set_targets(conn: sqlite3.Connection, user_id: Optional[str], targets: Mapping[str, float], save_target: float) -> None:
+    db.set_targets(conn, user_id, {**targets, SAVE_KEY: save_target})
+
+
+def get_advice(conn: sqlite3.Connection, user_id: Optional[str], ym: str) -> list[Verdict]:
+    """Avisos do usuário no mês `ym` (YYYY-MM), do cache quando o mês não mudou."""
+    versao = db.get_month_version(conn, user_id, ym)
+    cache = db.load_advice(conn, user_id, ym)
+    if cache is not None and cache[0] == versao:
+        return [Verdict(**v) for v in json.loads(cache[1])]
+
+    totais = db.get_month_category_totals(conn, user_id, ym)
+    desp = totais[totais["tipo"] == "Despesa"]
+    targets, save_target = get_targets(conn, user_id)
+    avisos = evaluate(
+        float(totais.loc[totais["tipo"] == "Receita", "valor"].sum()),
+        float(desp["valor"].sum()),
+        dict(zip(desp["categoria"], desp["valor"])),
+        targets,
+        save_target,
+    )
+    db.store_advice(conn, user_id, ym, versao, json.dumps([asdict(v) for v in avisos], ensure_ascii=False))
+    return avisos
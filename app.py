@@ -1,10 +1,14 @@
+import io
 import streamlit as st
-import pandas as pd
 import altair as alt
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
 import db
+import advice
+import diagnostics
+import writer
+from query_cache import QueryCache
 from categories import (
     CATEGORIES,
     get_categories,
@@ -17,43 +21,9 @@ from categories import (
 
 st.set_page_config(page_title="Controle Financeiro", page_icon="💰", layout="centered", initial_sidebar_state="collapsed")
 
-# Inicialização do banco
-conn = db.get_connection()
-db.init_db(conn)
-
-# --- Backward-compatibilidade com versões antigas de db.py no Cloud ---
-def safe_add_transaction(*args, **kwargs):
-    try:
-        return db.add_transaction(*args, **kwargs)
-    except TypeError:
-        # Remover user_id (último param) e tentar assinatura antiga
-        if len(args) >= 10:
-            args = args[:-1]
-        elif "user_id" in kwargs:
-            kwargs.pop("user_id", None)
-        return db.add_transaction(*args, **kwargs)
-
-
-def safe_get_transactions(conn, user_id, **k):
-    try:
-        return db.get_transactions(conn, user_id, **k)
-    except TypeError:
-        # assinatura antiga sem user_id
-        return db.get_transactions(conn, **k)
-
-
-def safe_get_monthly_cashflow(conn, inicio, fim, user_id):
-    try:
-        return db.get_monthly_cashflow(conn, inicio, fim, user_id)
-    except TypeError:
-        return db.get_monthly_cashflow(conn, inicio, fim)
-
-
-def safe_get_monthly_breakdown(conn, inicio, fim, user_id):
-    try:
-        return db.get_monthly_breakdown(conn, inicio, fim, user_id)
-    except TypeError:
-        return db.get_monthly_breakdown(conn, inicio, fim)
+# Instrumentação do banco (opt-in via FINANCE_DB_PROFILE=1); precisa vir antes da conexão
+diagnostics.setup_from_env()
+diagnostics.start_rerun()
 
 # Estado inicial
 if "filters" not in st.session_state:
@@ -64,6 +34,7 @@ if "filters" not in st.session_state:
         "data_inicio": date.today().replace(day=1) - relativedelta(months=5),
         "data_fim": date.today(),
         "busca": "",
+        "tag": "",
         "user_id": "",
     }
 if "compact" not in st.session_state:
@@ -119,23 +90,27 @@ if not st.session_state.filters["user_id"]:
                 st.warning("Informe um identificador válido.")
     st.stop()
 
+# Conexão do pool do processo (PRAGMAs e migrações já aplicados); no modo um
+# arquivo por usuário (FINANCE_SHARDS_DIR), o pool do arquivo deste usuário
+conn = db.get_connection(st.session_state.filters["user_id"])
+
 st.title("💰 Controle Financeiro - Ganhos e Gastos")
 
 st.markdown("#### Lançamento rápido")
 tipo = st.radio("Tipo", ["Despesa", "Receita"], horizontal=True)
 # Categorias dependem do tipo selecionado
 if tipo == "Receita":
-    categorias = ["Selecionar..."] + get_income_categories()
+    categorias = ("Selecionar...", *get_income_categories())
 else:
-    categorias = ["Selecionar..."] + get_categories()
+    categorias = ("Selecionar...", *get_categories())
 categoria = st.selectbox("Categoria", categorias, index=0)
 if categoria == "Selecionar...":
-    subcategorias = ["Selecionar..."]
+    subcategorias = ("Selecionar...",)
 else:
     if tipo == "Receita":
-        subcategorias = ["Selecionar..."] + get_income_subcategories(categoria)
+        subcategorias = ("Selecionar...", *get_income_subcategories(categoria))
     else:
-        subcategorias = ["Selecionar..."] + get_subcategories(categoria)
+        subcategorias = ("Selecionar...", *get_subcategories(categoria))
 subcategoria = st.selectbox("Subcategoria", subcategorias, index=0)
 
 col1, col2 = st.columns(2)
@@ -154,77 +129,105 @@ if st.button("Salvar lançamento", type="primary", use_container_width=True):
     elif valor <= 0:
         st.warning("Informe um valor maior que zero.")
     else:
-        safe_add_transaction(
-            conn,
-            data_lanc,
-            tipo,
-            categoria,
-            subcategoria,
-            descricao,
-            float(valor) if tipo == "Despesa" else float(valor),
-            conta,
-            tags,
+        # Fila de escrita: uma thread grava os lançamentos de todas as sessões
+        # em lotes; a sessão só espera o commit do seu
+        salvo = writer.add_transaction(
             st.session_state.filters["user_id"],
+            data_lanc=data_lanc,
+            tipo=tipo,
+            categoria=categoria,
+            subcategoria=subcategoria,
+            descricao=descricao,
+            valor=float(valor),
+            conta=conta,
+            tags=tags,
         )
-        st.success("Lançamento salvo!")
-
-    st.divider()
-    st.header("Filtros (opcional)")
-
-    tipos = ["Todos", "Despesa", "Receita"]
-    st.session_state.filters["tipo"] = st.selectbox("Tipo", tipos, index=0)
+        try:
+            salvo.result(timeout=30)
+            st.success("Lançamento salvo!")
+        except Exception as e:
+            st.error(f"Erro ao salvar: {e}")
 
-    # No filtro, mostrar categorias combinadas de despesas e receitas
-    cat_filtro = ["Todas"] + get_all_categories()
-    st.session_state.filters["categoria"] = st.selectbox("Categoria", cat_filtro, index=0)
+# Filtros renderizados a cada rerun (fora do botão de salvar)
+st.divider()
+st.header("Filtros (opcional)")
 
-    if st.session_state.filters["categoria"] == "Todas":
-        subcat_filtro = ["Todas"]
-    else:
-        subcat_filtro = ["Todas"] + get_any_subcategories(st.session_state.filters["categoria"])
-    st.session_state.filters["subcategoria"] = st.selectbox("Subcategoria", subcat_filtro, index=0)
+tipos = ["Todos", "Despesa", "Receita"]
+st.session_state.filters["tipo"] = st.selectbox("Tipo", tipos, index=0)
 
-    st.session_state.filters["data_inicio"] = st.date_input(
-        "Data inicial",
-        value=st.session_state.filters["data_inicio"],
-        format="DD/MM/YYYY",
-    )
-    st.session_state.filters["data_fim"] = st.date_input(
-        "Data final",
-        value=st.session_state.filters["data_fim"],
-        format="DD/MM/YYYY",
-    )
-    st.session_state.filters["busca"] = st.text_input("Buscar por descrição/conta/tags")
+# No filtro, mostrar categorias combinadas de despesas e receitas
+cat_filtro = ("Todas", *get_all_categories())
+st.session_state.filters["categoria"] = st.selectbox("Categoria", cat_filtro, index=0)
 
-# Tabs principais
-aba = st.tabs(["Visão geral", "Transações", "Relatórios", "Importar/Exportar"])
+if st.session_state.filters["categoria"] == "Todas":
+    subcat_filtro = ("Todas",)
+else:
+    subcat_filtro = ("Todas", *get_any_subcategories(st.session_state.filters["categoria"]))
+st.session_state.filters["subcategoria"] = st.selectbox("Subcategoria", subcat_filtro, index=0)
 
-def carregar_transacoes():
+st.session_state.filters["data_inicio"] = st.date_input(
+    "Data inicial",
+    value=st.session_state.filters["data_inicio"],
+    format="DD/MM/YYYY",
+)
+st.session_state.filters["data_fim"] = st.date_input(
+    "Data final",
+    value=st.session_state.filters["data_fim"],
+    format="DD/MM/YYYY",
+)
+st.session_state.filters["busca"] = st.text_input("Buscar por descrição/conta/tags")
+st.session_state.filters["tag"] = st.text_input("Tag", placeholder="Ex.: #mercado")
+
+# Cache de leituras da sessão: uma consulta (versão dos dados) por rerun enquanto
+# filtros e dados não mudarem
+if "_query_cache" not in st.session_state:
+    st.session_state["_query_cache"] = {}
+qc = QueryCache(st.session_state["_query_cache"])
+with diagnostics.section("versão dos dados"):
+    qc.sync(conn, st.session_state.filters["user_id"])
+
+def filtros_consulta():
+    # Filtros da barra no formato dos parâmetros de db.get_transactions*
     f = st.session_state.filters
-    df = safe_get_transactions(
-        conn,
-        f["user_id"],
+    return dict(
         tipo=None if f["tipo"] == "Todos" else f["tipo"],
         categoria=None if f["categoria"] == "Todas" else f["categoria"],
         subcategoria=None if f["subcategoria"] == "Todas" else f["subcategoria"],
         data_inicio=f["data_inicio"],
         data_fim=f["data_fim"],
         busca=f["busca"],
+        tag=f.get("tag", ""),
     )
-    return df
 
-with aba[0]:
+
+def gerar_exportacao(uid, formato, compactar):
+    # Bytes do arquivo de exportação com os filtros atuais
+    if formato == "CSV":
+        # CSV gerado em blocos direto do cursor do banco (sem DataFrame intermediário)
+        dados = b"".join(db.iter_transactions_csv(conn, uid, **filtros_consulta(), compress=compactar))
+        if compactar:
+            return {"dados": dados, "arquivo": "transacoes.csv.gz", "mime": "application/gzip"}
+        return {"dados": dados, "arquivo": "transacoes.csv", "mime": "text/csv"}
+    # Colunar com tipos (data, valor decimal, categorias) para cópia rápida entre instâncias/análises
+    fmt, ext = ("parquet", "parquet") if formato == "Parquet" else ("arrow", "arrows")
+    buf = io.BytesIO()
+    db.export_transactions_columnar(conn, buf, fmt, user_id=uid, **filtros_consulta())
+    return {"dados": buf.getvalue(), "arquivo": f"transacoes.{ext}", "mime": "application/octet-stream"}
+
+def secao_visao_geral():
     st.subheader("Resumo e Indicadores")
-    df = carregar_transacoes()
+    # Um único passe no banco alimenta todos os indicadores e gráficos da aba
+    with diagnostics.section("dados"):
+        snap = qc.get(db.get_dashboard_snapshot, conn, st.session_state.filters)
     if st.session_state.compact:
         col1, col2, col3 = st.columns(1), None, None  # métricas empilhadas
         col_metrics = st.container()
     else:
         col1, col2, col3 = st.columns(3)
         col_metrics = None
-    total_receitas = df.loc[df.tipo == "Receita", "valor"].sum()
-    total_despesas = df.loc[df.tipo == "Despesa", "valor"].sum()
-    saldo = total_receitas - total_despesas
+    total_receitas = snap.total_receitas
+    total_despesas = snap.total_despesas
+    saldo = snap.saldo
     if st.session_state.compact:
         st.metric("Receitas", f"R$ {total_receitas:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
         st.metric("Despesas", f"R$ {total_despesas:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
@@ -235,239 +238,377 @@ with aba[0]:
         col3.metric("Saldo", f"R$ {saldo:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."), delta=None)
 
     # Fluxo por mês
-    fluxo = safe_get_monthly_cashflow(conn, st.session_state.filters["data_inicio"], st.session_state.filters["data_fim"], st.session_state.filters["user_id"])
-    if not fluxo.empty:
-        c = alt.Chart(fluxo).mark_bar().encode(
-            x=alt.X("mes:N", title="Mês"),
-            y=alt.Y("valor:Q", title="Saldo"),
-            color=alt.condition(alt.datum.valor >= 0, alt.value("#16a34a"), alt.value("#dc2626")),
-            tooltip=["mes", "valor"],
-        ).properties(height=180 if st.session_state.compact else 300)
-        st.altair_chart(c, use_container_width=True)
+    with diagnostics.section("gráfico fluxo"):
+        fluxo = snap.cashflow
+        if not fluxo.empty:
+            c = alt.Chart(fluxo).mark_bar().encode(
+                x=alt.X("mes:N", title="Mês"),
+                y=alt.Y("valor:Q", title="Saldo"),
+                color=alt.condition(alt.datum.valor >= 0, alt.value("#16a34a"), alt.value("#dc2626")),
+                tooltip=["mes", "valor"],
+            ).properties(height=180 if st.session_state.compact else 300)
+            st.altair_chart(c, use_container_width=True)
 
     # Comparativo mês a mês (Receitas, Despesas, Saldo)
-    brkd = safe_get_monthly_breakdown(conn, st.session_state.filters["data_inicio"], st.session_state.filters["data_fim"], st.session_state.filters["user_id"])
-    if not brkd.empty and len(brkd) >= 2:
-        # pegar mês atual do range (último) e anterior
-        curr = brkd.iloc[-1]
-        prev = brkd.iloc[-2]
-        if st.session_state.compact:
-            # empilhar métricas
-            st.metric(
-                label=f"Receitas ({curr['mes']})",
-                value=f"R$ {curr['receitas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-                delta=f"{((curr['receitas'] - prev['receitas'])/prev['receitas']*100 if prev['receitas'] else 0):.1f}% vs {prev['mes']}",
-                delta_color="normal",
-            )
-            st.metric(
-                label=f"Despesas ({curr['mes']})",
-                value=f"R$ {curr['despesas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-                delta=f"{((curr['despesas'] - prev['despesas'])/prev['despesas']*100 if prev['despesas'] else 0):.1f}% vs {prev['mes']}",
-                delta_color="inverse",
-            )
-            st.metric(
-                label=f"Saldo ({curr['mes']})",
-                value=f"R$ {curr['saldo']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-                delta=f"{((curr['saldo'] - prev['saldo'])/abs(prev['saldo'])*100 if prev['saldo'] else 0):.1f}% vs {prev['mes']}",
-                delta_color="normal",
-            )
-        else:
-            m1, m0, m2 = st.columns(3)
-            with m1:
+    with diagnostics.section("comparativo e avisos"):
+        brkd = snap.breakdown
+        if not brkd.empty and len(brkd) >= 2:
+            # pegar mês atual do range (último) e anterior
+            curr = brkd.iloc[-1]
+            prev = brkd.iloc[-2]
+            if st.session_state.compact:
+                # empilhar métricas
                 st.metric(
                     label=f"Receitas ({curr['mes']})",
                     value=f"R$ {curr['receitas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
                     delta=f"{((curr['receitas'] - prev['receitas'])/prev['receitas']*100 if prev['receitas'] else 0):.1f}% vs {prev['mes']}",
                     delta_color="normal",
                 )
-            with m0:
                 st.metric(
                     label=f"Despesas ({curr['mes']})",
                     value=f"R$ {curr['despesas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
                     delta=f"{((curr['despesas'] - prev['despesas'])/prev['despesas']*100 if prev['despesas'] else 0):.1f}% vs {prev['mes']}",
                     delta_color="inverse",
                 )
-            with m2:
                 st.metric(
                     label=f"Saldo ({curr['mes']})",
                     value=f"R$ {curr['saldo']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
                     delta=f"{((curr['saldo'] - prev['saldo'])/abs(prev['saldo'])*100 if prev['saldo'] else 0):.1f}% vs {prev['mes']}",
                     delta_color="normal",
                 )
-
-        # Avisos de especialista financeiro (guidelines simples)
-        st.markdown("### Avisos e recomendações")
-        receitas_m = float(curr["receitas"]) or 0.0
-        despesas_m = float(curr["despesas"]) or 0.0
-        saldo_m = float(curr["saldo"]) or 0.0
-
-        # Percentuais recomendados (exemplos comuns)
-        targets = {
-            "Moradia": 0.30,
-            "Alimentação": 0.15,
-            "Transporte": 0.15,
-            "Lazer": 0.10,
-            "Dívidas/Crédito": 0.20,
-        }
-
-        # Filtrar apenas mês corrente para distribuição por categoria de despesas
-        df_curr = df.copy()
-        try:
-            # Tentar detectar o ano-mês corrente em formato label e filtrar por data
-            # Usamos ym do breakdown para precisão
-            ym_curr = brkd.iloc[-1]["ym"]
-            ano, mes = ym_curr.split("-")
-            df_curr = df[(pd.to_datetime(df["data"]).dt.strftime('%Y-%m') == ym_curr)]
-        except Exception:
-            pass
-
-        desp_cat = (
-            df_curr[df_curr["tipo"] == "Despesa"].groupby("categoria")["valor"].sum().sort_values(ascending=False)
-            if not df_curr.empty
-            else pd.Series(dtype=float)
-        )
-
-        # Regra: poupar pelo menos 20% da renda
-        save_target = 0.20
-        if receitas_m > 0:
-            if saldo_m >= receitas_m * save_target:
-                st.success(f"Poupança/meta: OK — economia de {saldo_m/receitas_m*100:.1f}% (alvo: {save_target*100:.0f}%)")
             else:
-                st.warning(f"Poupança/meta: Abaixo do recomendado — {saldo_m/receitas_m*100:.1f}% (alvo: {save_target*100:.0f}%)")
-        else:
-            st.info("Sem receitas no mês para avaliar poupança/meta.")
-
-        # Regras por categoria
-        if not desp_cat.empty and receitas_m > 0:
-            for cat, pct in targets.items():
-                val = float(desp_cat.get(cat, 0.0))
-                share = val / receitas_m
-                if share <= pct:
-                    st.success(f"{cat}: {share*100:.1f}% da renda (alvo <= {pct*100:.0f}%)")
-                else:
-                    st.warning(f"{cat}: {share*100:.1f}% da renda — acima do recomendado (alvo <= {pct*100:.0f}%)")
-        elif receitas_m == 0 and despesas_m > 0:
-            st.warning("Há despesas, mas nenhuma receita registrada no mês corrente.")
+                m1, m0, m2 = st.columns(3)
+                with m1:
+                    st.metric(
+                        label=f"Receitas ({curr['mes']})",
+                        value=f"R$ {curr['receitas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+                        delta=f"{((curr['receitas'] - prev['receitas'])/prev['receitas']*100 if prev['receitas'] else 0):.1f}% vs {prev['mes']}",
+                        delta_color="normal",
+                    )
+                with m0:
+                    st.metric(
+                        label=f"Despesas ({curr['mes']})",
+                        value=f"R$ {curr['despesas']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+                        delta=f"{((curr['despesas'] - prev['despesas'])/prev['despesas']*100 if prev['despesas'] else 0):.1f}% vs {prev['mes']}",
+                        delta_color="inverse",
+                    )
+                with m2:
+                    st.metric(
+                        label=f"Saldo ({curr['mes']})",
+                        value=f"R$ {curr['saldo']:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+                        delta=f"{((curr['saldo'] - prev['saldo'])/abs(prev['saldo'])*100 if prev['saldo'] else 0):.1f}% vs {prev['mes']}",
+                        delta_color="normal",
+                    )
+
+            # Avisos de especialista financeiro (guidelines simples), pré-calculados por mês
+            st.markdown("### Avisos e recomendações")
+            uid = st.session_state.filters["user_id"]
+            for aviso in qc.get(advice.get_advice, conn, uid, snap.ym_atual):
+                {"ok": st.success, "alerta": st.warning}.get(aviso.nivel, st.info)(aviso.mensagem)
+            with st.expander("Metas dos avisos"):
+                targets, save_target = advice.get_targets(conn, uid)
+                novo_save = st.number_input(
+                    "Poupança mínima (% da renda)", 0.0, 100.0, save_target * 100, step=1.0, key="meta_poupanca"
+                )
+                novos = {
+                    cat: st.number_input(
+                        f"{cat} (teto, % da renda)", 0.0, 100.0, pct * 100, step=1.0, key=f"meta_{cat}"
+                    ) / 100
+                    for cat, pct in targets.items()
+                }
+                if st.button("Salvar metas", key="metas_salvar"):
+                    advice.set_targets(conn, uid, novos, novo_save / 100)
+                    st.success("Metas salvas.")
 
     # Por categoria
-    por_cat = db.get_sum_by_category(conn, st.session_state.filters)
-    if not por_cat.empty:
-        if st.session_state.compact:
-            # Gráfico de barras para leitura rápida em telas pequenas
-            barc = alt.Chart(por_cat).mark_bar().encode(
-                x=alt.X("valor:Q", title="Total"),
-                y=alt.Y("categoria:N", sort='-x', title="Categoria"),
-                tooltip=["categoria", "valor"],
-            ).properties(height=220)
-            st.altair_chart(barc, use_container_width=True)
-        else:
-            pie = alt.Chart(por_cat).mark_arc().encode(
-                theta="valor:Q",
-                color=alt.Color("categoria:N", legend=None),
-                tooltip=["categoria", "valor"],
-            ).properties(height=300)
-            st.altair_chart(pie, use_container_width=True)
+    with diagnostics.section("gráfico categorias"):
+        por_cat = snap.por_categoria
+        if not por_cat.empty:
+            if st.session_state.compact:
+                # Gráfico de barras para leitura rápida em telas pequenas
+                barc = alt.Chart(por_cat).mark_bar().encode(
+                    x=alt.X("valor:Q", title="Total"),
+                    y=alt.Y("categoria:N", sort='-x', title="Categoria"),
+                    tooltip=["categoria", "valor"],
+                ).properties(height=220)
+                st.altair_chart(barc, use_container_width=True)
+            else:
+                pie = alt.Chart(por_cat).mark_arc().encode(
+                    theta="valor:Q",
+                    color=alt.Color("categoria:N", legend=None),
+                    tooltip=["categoria", "valor"],
+                ).properties(height=300)
+                st.altair_chart(pie, use_container_width=True)
 
     # Novidade: Gastos por Subcategoria (filtrável por Categoria)
     st.markdown("### Gastos por Subcategoria")
-    despesas_df = df[df["tipo"] == "Despesa"].copy()
-    cat_options = sorted(despesas_df["categoria"].dropna().unique().tolist()) if not despesas_df.empty else []
-    if not cat_options:
-        st.info("Sem despesas no período para detalhar subcategorias.")
-    else:
-        sel_cat = st.selectbox("Categoria para detalhar", options=cat_options, index=0)
-        sub_df = (
-            despesas_df[despesas_df["categoria"] == sel_cat]
-            .groupby("subcategoria", as_index=False)["valor"].sum()
-            .sort_values("valor", ascending=False)
-        )
-        if sub_df.empty:
-            st.info("Sem subcategorias encontradas para a categoria selecionada.")
+    with diagnostics.section("subcategorias"):
+        por_subcat = snap.por_subcategoria
+        cat_options = sorted(por_subcat["categoria"].unique().tolist()) if not por_subcat.empty else []
+        if not cat_options:
+            st.info("Sem despesas no período para detalhar subcategorias.")
         else:
-            h = 220 if st.session_state.compact else max(260, 18 * len(sub_df))
-            sub_chart = alt.Chart(sub_df).mark_bar().encode(
-                x=alt.X("valor:Q", title="Total"),
-                y=alt.Y("subcategoria:N", sort='-x', title="Subcategoria"),
-                tooltip=["subcategoria", "valor"],
-            ).properties(height=h)
-            st.altair_chart(sub_chart, use_container_width=True)
-
-with aba[1]:
+            sel_cat = st.selectbox("Categoria para detalhar", options=cat_options, index=0)
+            sub_df = por_subcat.loc[por_subcat["categoria"] == sel_cat, ["subcategoria", "valor"]]
+            if sub_df.empty:
+                st.info("Sem subcategorias encontradas para a categoria selecionada.")
+            else:
+                h = 220 if st.session_state.compact else max(260, 18 * len(sub_df))
+                sub_chart = alt.Chart(sub_df).mark_bar().encode(
+                    x=alt.X("valor:Q", title="Total"),
+                    y=alt.Y("subcategoria:N", sort='-x', title="Subcategoria"),
+                    tooltip=["subcategoria", "valor"],
+                ).properties(height=h)
+                st.altair_chart(sub_chart, use_container_width=True)
+
+def secao_transacoes():
     st.subheader("Transações")
-    df = carregar_transacoes()
-    if df.empty:
+    # Tabela paginada por cursor: busca só a página visível e o total
+    TAM_PAGINA = 50
+    filtros_tx = filtros_consulta()
+    pag = st.session_state.setdefault("tx_pagina", {"filtros": None, "cursores": []})
+    if pag["filtros"] != filtros_tx:
+        pag["filtros"] = filtros_tx
+        pag["cursores"] = []
+    uid = st.session_state.filters["user_id"]
+    with diagnostics.section("contagem"):
+        total_tx = qc.get(db.count_transactions, conn, uid, **filtros_tx)
+    if total_tx == 0:
         st.info("Nenhum lançamento encontrado para os filtros selecionados.")
     else:
-        st.dataframe(
-            df[["data", "tipo", "categoria", "subcategoria", "descricao", "valor", "conta", "tags"]]
-            .sort_values("data", ascending=False)
-            .reset_index(drop=True),
-            use_container_width=True,
-            hide_index=True,
+        after = pag["cursores"][-1] if pag["cursores"] else None
+        with diagnostics.section("página"):
+            pagina = qc.get(db.get_transactions_page, conn, uid, **filtros_tx, page_size=TAM_PAGINA, after=after)
+        with diagnostics.section("tabela"):
+            st.dataframe(
+                pagina[["data", "tipo", "categoria", "subcategoria", "descricao", "valor", "conta", "tags"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+        n_paginas = -(-total_tx // TAM_PAGINA)
+        atual = len(pag["cursores"]) + 1
+        col_ant, col_info, col_prox = st.columns([1, 2, 1])
+        col_ant.button(
+            "← Anterior",
+            key="tx_anterior",
+            disabled=atual <= 1,
+            on_click=lambda: pag["cursores"].pop(),
+        )
+        col_info.caption(f"Página {atual} de {n_paginas} · {total_tx} lançamentos")
+        col_prox.button(
+            "Próxima →",
+            key="tx_proxima",
+            disabled=atual >= n_paginas or pagina.empty,
+            on_click=lambda: pag["cursores"].append(db.page_cursor(pagina.iloc[-1])),
         )
 
-with aba[2]:
+def secao_relatorios():
     st.subheader("Relatórios")
-    st.caption("Relatórios básicos. Em breve: exportações detalhadas e gráficos adicionais.")
-    df = carregar_transacoes()
+    st.caption("Agregados calculados no banco a partir do resumo mensal (meses inteiros do período).")
+    f = st.session_state.filters
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("### Gastos por Categoria")
-        por_cat = (
-            df[df["tipo"] == "Despesa"].groupby(["categoria"], as_index=False)["valor"].sum()
-        )
-        if not por_cat.empty:
-            bar = alt.Chart(por_cat).mark_bar().encode(x="categoria:N", y="valor:Q", tooltip=["categoria", "valor"]).properties(height=300)
-            st.altair_chart(bar, use_container_width=True)
-        else:
-            st.info("Sem dados de despesas para o período.")
+        with diagnostics.section("agregação despesas"):
+            por_cat = qc.get(db.get_sum_by_category, conn, f, "Despesa")
+        with diagnostics.section("gráfico despesas"):
+            if not por_cat.empty:
+                bar = alt.Chart(por_cat).mark_bar().encode(x="categoria:N", y="valor:Q", tooltip=["categoria", "valor"]).properties(height=300)
+                st.altair_chart(bar, use_container_width=True)
+            else:
+                st.info("Sem dados de despesas para o período.")
     with col2:
         st.markdown("### Receitas por Categoria")
-        por_cat_r = (
-            df[df["tipo"] == "Receita"].groupby(["categoria"], as_index=False)["valor"].sum()
-        )
-        if not por_cat_r.empty:
-            bar2 = alt.Chart(por_cat_r).mark_bar(color="#16a34a").encode(x="categoria:N", y="valor:Q", tooltip=["categoria", "valor"]).properties(height=300)
-            st.altair_chart(bar2, use_container_width=True)
+        with diagnostics.section("agregação receitas"):
+            por_cat_r = qc.get(db.get_sum_by_category, conn, f, "Receita")
+        with diagnostics.section("gráfico receitas"):
+            if not por_cat_r.empty:
+                bar2 = alt.Chart(por_cat_r).mark_bar(color="#16a34a").encode(x="categoria:N", y="valor:Q", tooltip=["categoria", "valor"]).properties(height=300)
+                st.altair_chart(bar2, use_container_width=True)
+            else:
+                st.info("Sem dados de receitas para o período.")
+
+    st.markdown("### Tendência das despesas")
+    with diagnostics.section("tendências"):
+        tend = qc.get(db.get_monthly_trends, conn, f["user_id"], f["data_inicio"], f["data_fim"])
+        if tend["despesas"].any():
+            series = tend.melt(
+                id_vars=["mes", "ym"],
+                value_vars=["despesas", "despesas_mm3", "despesas_mm6", "despesas_mm12"],
+                var_name="serie",
+                value_name="valor",
+            ).replace({"serie": {
+                "despesas": "Despesas",
+                "despesas_mm3": "Média 3 meses",
+                "despesas_mm6": "Média 6 meses",
+                "despesas_mm12": "Média 12 meses",
+            }})
+            linhas = alt.Chart(series).mark_line(point=True).encode(
+                x=alt.X("mes:N", sort=None, title="Mês"),
+                y=alt.Y("valor:Q", title="Despesas"),
+                color=alt.Color("serie:N", title=None),
+                tooltip=["mes", "serie", alt.Tooltip("valor:Q", format=",.2f")],
+            ).properties(height=300)
+            st.altair_chart(linhas, use_container_width=True)
+
+            st.markdown("### Saldo acumulado")
+            acum = alt.Chart(tend).mark_area(opacity=0.4, line=True).encode(
+                x=alt.X("mes:N", sort=None, title="Mês"),
+                y=alt.Y("saldo_acumulado:Q", title="Saldo acumulado"),
+                tooltip=["mes", alt.Tooltip("saldo:Q", format=",.2f"), alt.Tooltip("saldo_acumulado:Q", format=",.2f")],
+            ).properties(height=220)
+            st.altair_chart(acum, use_container_width=True)
         else:
-            st.info("Sem dados de receitas para o período.")
+            st.info("Sem despesas no período para calcular tendências.")
+
+    st.markdown("### Despesas: comparação com o ano anterior")
+    with diagnostics.section("ano contra ano"):
+        yoy = qc.get(db.get_category_yoy, conn, f["user_id"], f["data_inicio"], f["data_fim"])
+        if not yoy.empty:
+            st.dataframe(
+                yoy.assign(variacao=yoy["variacao"] * 100),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "categoria": "Categoria",
+                    "valor": st.column_config.NumberColumn("Período", format="R$ %.2f"),
+                    "valor_ano_anterior": st.column_config.NumberColumn("Ano anterior", format="R$ %.2f"),
+                    "variacao": st.column_config.NumberColumn("Variação", format="%.1f%%"),
+                },
+            )
+        else:
+            st.info("Sem despesas no período nem no ano anterior.")
+
+    st.markdown("### Gastos por Tag")
+    with diagnostics.section("gastos por tag"):
+        por_tag = qc.get(db.get_spend_by_tag, conn, f["user_id"], f["data_inicio"], f["data_fim"])
+        if not por_tag.empty:
+            barras = alt.Chart(por_tag).mark_bar().encode(
+                x=alt.X("mes:N", sort=None, title="Mês"),
+                y=alt.Y("valor:Q", title="Despesas"),
+                color="tag:N",
+                tooltip=["mes", "tag", "valor", "qtd"],
+            ).properties(height=300)
+            st.altair_chart(barras, use_container_width=True)
+        else:
+            st.info("Nenhuma despesa com tags no período.")
 
-with aba[3]:
+def secao_importar_exportar():
     st.subheader("Importar/Exportar")
     st.caption("Funcionalidades básicas de exportação. Importação CSV mínima.")
 
-    df = carregar_transacoes()
-    if not df.empty:
-        csv = df.to_csv(index=False).encode("utf-8-sig")
-        st.download_button("Exportar CSV (filtros aplicados)", csv, file_name="transacoes.csv", mime="text/csv")
+    uid = st.session_state.filters["user_id"]
+    if qc.get(db.count_transactions, conn, uid, **filtros_consulta()) > 0:
+        formato = st.radio("Formato", ["CSV", "Parquet", "Arrow IPC"], horizontal=True)
+        compactar = formato == "CSV" and st.checkbox("Compactar (gzip) — recomendado para históricos grandes", value=False)
+        # Arquivo gerado só a pedido e nunca guardado na sessão: os bytes vivem
+        # apenas no botão deste rerun. Baixar (ou qualquer outra interação)
+        # dispara um novo rerun sem o botão, e o Streamlit descarta o arquivo
+        # depois de servi-lo
+        if st.button("Gerar arquivo (filtros aplicados)", key="exp_gerar"):
+            with diagnostics.section("exportação"):
+                pronto = gerar_exportacao(uid, formato, compactar)
+            st.download_button(
+                f"Baixar {pronto['arquivo']}",
+                pronto["dados"],
+                file_name=pronto["arquivo"],
+                mime=pronto["mime"],
+            )
     else:
         st.info("Sem dados para exportar.")
 
-    st.markdown("#### Importar CSV")
-    up = st.file_uploader("Selecione um arquivo CSV com colunas: data,tipo,categoria,subcategoria,descricao,valor,conta,tags", type=["csv"])
-    if up is not None:
-        try:
-            imp = pd.read_csv(up)
-            required = {"data", "tipo", "categoria", "subcategoria", "descricao", "valor", "conta", "tags"}
-            if not required.issubset(set(imp.columns)):
-                st.error("Arquivo CSV inválido. Colunas obrigatórias ausentes.")
-            else:
-                linhas = 0
-                for _, row in imp.iterrows():
-                    dt = pd.to_datetime(row["data"]).date()
-                    safe_add_transaction(
-                        conn,
-                        dt,
-                        str(row["tipo"]),
-                        str(row["categoria"]),
-                        str(row["subcategoria"]),
-                        str(row.get("descricao", "")),
-                        float(row["valor"]),
-                        str(row.get("conta", "")),
-                        str(row.get("tags", "")),
-                        st.session_state.filters["user_id"],
+    st.markdown("#### Importar CSV, Parquet ou Arrow")
+    up = st.file_uploader(
+        "Selecione um arquivo com colunas: data,tipo,categoria,subcategoria,descricao,valor,conta,tags",
+        type=["csv", "parquet", "arrows", "arrow"],
+    )
+    with diagnostics.section("importação"):
+        if up is not None:
+            try:
+                uid = st.session_state.filters["user_id"]
+                pronto = st.session_state.get("_importacao")
+                if pronto is not None and pronto["arquivo"] == (up.file_id, uid):
+                    # Mesmo upload em um novo rerun: mostra o relatório já gerado
+                    rep = pronto["relatorio"]
+                elif up.name.lower().endswith(".csv"):
+                    # CSV em blocos, com ponto de retomada se a importação for interrompida
+                    rep = db.import_csv_stream(conn, up, uid, nome=up.name)
+                else:
+                    rep = db.bulk_insert_transactions(conn, db.read_transactions_columnar(up), uid)
+                st.session_state["_importacao"] = {"arquivo": (up.file_id, uid), "relatorio": rep}
+                if rep.resumed_from:
+                    st.info(f"Este arquivo já tinha sido importado (total ou parcialmente): as primeiras {rep.resumed_from} linhas foram puladas.")
+                st.success(f"Importação concluída: {rep.inserted} linhas.")
+                if rep.duplicates:
+                    st.info(f"{rep.duplicates} linhas já tinham sido importadas antes e foram ignoradas.")
+                if rep.adjusted:
+                    st.info(f"{rep.adjusted} linhas tiveram categoria/subcategoria ajustada para os nomes da lista de categorias.")
+                if rep.rejected_count:
+                    st.warning(f"{rep.rejected_count} linhas recusadas (não importadas).")
+                    if rep.rejected_count > len(rep.rejected):
+                        st.caption(f"Mostrando as primeiras {len(rep.rejected)}.")
+                    # Índice = nº da linha no arquivo, a partir de 0 (sem o cabeçalho)
+                    st.dataframe(rep.rejected, use_container_width=True)
+                    st.download_button(
+                        "Baixar relatório de linhas recusadas",
+                        rep.rejected.to_csv(index_label="linha").encode("utf-8-sig"),
+                        file_name="linhas_recusadas.csv",
+                        mime="text/csv",
                     )
-                    linhas += 1
-                st.success(f"Importação concluída: {linhas} linhas.")
-        except Exception as e:
-            st.error(f"Erro ao importar: {e}")
+            except Exception as e:
+                st.error(f"Erro ao importar: {e}")
+
+def flag_da_url(nome):
+    # ?nome=1 na URL
+    try:
+        return str(st.query_params.get(nome, "")).strip() in ("1", "true", "True")  # type: ignore[attr-defined]
+    except Exception:
+        return False
+
+
+SECOES = {
+    "Visão geral": secao_visao_geral,
+    "Transações": secao_transacoes,
+    "Relatórios": secao_relatorios,
+    "Importar/Exportar": secao_importar_exportar,
+}
+
+if flag_da_url("abas"):
+    # Modo clássico (?abas=1): st.tabs executa todas as seções a cada rerun
+    for aba, (nome, secao) in zip(st.tabs(list(SECOES)), SECOES.items()):
+        with aba, diagnostics.section(nome):
+            secao()
+else:
+    # Só a seção escolhida consulta o banco e monta gráficos/tabelas
+    nome_secao = st.radio("Seção", list(SECOES), horizontal=True, key="secao", label_visibility="collapsed")
+    with diagnostics.section(nome_secao):
+        SECOES[nome_secao]()
+
+# Painel de diagnóstico: ?debug=1 na URL. Tempos por seção sempre; consultas ao
+# banco quando o app é iniciado com FINANCE_DB_PROFILE=1
+if flag_da_url("debug"):
+    with st.expander("Diagnóstico (este rerun)", expanded=False):
+        st.caption(f"Rerun até aqui: {diagnostics.rerun_elapsed_ms():.1f} ms")
+        secoes = diagnostics.rerun_sections()
+        if not diagnostics.ENABLED:
+            secoes = secoes.drop(columns=["db_ms", "db_chamadas"])
+        st.dataframe(secoes.drop(columns=["caminho"]), use_container_width=True, hide_index=True)
+        if not diagnostics.ENABLED:
+            st.info("Consultas ao banco não instrumentadas. Inicie o app com FINANCE_DB_PROFILE=1 para medi-las.")
+        else:
+            tot = diagnostics.rerun_totals()
+            st.caption(
+                f"{tot['chamadas']} chamadas ao db · {tot['instrucoes_sql']} instruções SQL · {tot['ms']:.1f} ms"
+            )
+            st.dataframe(diagnostics.rerun_calls(), use_container_width=True, hide_index=True)
+            # ?debug=1 é aberto a qualquer visitante: só as consultas lentas do próprio usuário
+            # (o log do processo guarda ids de todas as sessões)
+            lentas = [rec for rec in diagnostics.SLOW_LOG if rec.user_id == st.session_state.filters["user_id"]]
+            if lentas:
+                st.markdown(f"**Consultas lentas (>= {diagnostics.SLOW_QUERY_MS:.0f} ms, deste usuário)**")
+                for rec in reversed(lentas):
+                    st.text(f"{rec.function} · {rec.elapsed_ms:.1f} ms · usuário={rec.user_id} · filtros={rec.filters}")
+                    for sql, plan in rec.plans.items():
+                        st.code(f"{sql}\n-- plano: {' | '.join(plan)}", language="sql")
+
+diagnostics.finish_rerun()
@@ -0,0 +1,333 @@
+"""Benchmarks do banco (`python bench.py <cenário>`).
+
+Rodam contra um arquivo SQLite temporário (com fsync real), nunca contra o
+`finance.db` do app.
+
+- `import`: importação em lote de um CSV sintético.
+- `writes`: latência de salvar lançamentos com várias sessões ao mesmo tempo,
+  direto (`db.add_transaction`) e pela fila de escrita (`writer`).
+- `queries`: mede cada função pública de consulta do `db` em bases de 10k,
+  100k e 1M linhas e grava os resultados em JSON; com `--baseline`, compara
+  com uma execução anterior e falha se alguma função ficou mais lenta que o
+  limite.
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import db
+import writer
+from categories import CATEGORIES, INCOME_CATEGORIES
+
+# Peso relativo das categorias de despesa (frequência de lançamentos)
+EXPENSE_WEIGHTS = {
+    "Alimentação": 8, "Transporte": 5, "Moradia": 3, "Lazer": 3, "Pessoais": 2,
+    "Assinaturas/Serviços": 2, "Saúde": 2, "Casa": 2,
+}
+# Valor mediano (R$) por categoria; o resto usa DEFAULT_MEDIAN
+CATEGORY_MEDIAN = {
+    "Moradia": 900, "Alimentação": 60, "Transporte": 80, "Educação": 400, "Viagens": 700,
+    "Investimentos": 500, "Dívidas/Crédito": 600, "Salário": 5000, "Freelance": 1500,
+    "Rendimentos": 200, "Reembolsos": 150, "Outros": 300,
+}
+DEFAULT_MEDIAN = 120
+CONTAS = ["Nubank", "Itaú", "Carteira", "Inter", "Bradesco", "C6"]
+TAGS = ["", "", "", "#mercado", "#trabalho", "#casa #fixo", "#viagem", "#lazer"]
+
+
+def generate_transactions(
+    rows: int,
+    users: int = 20,
+    years: int = 5,
+    seed: int = 42,
+    end: date = date(2025, 12, 31),
+) -> pd.DataFrame:
+    """Gera lançamentos sintéticos reproduzíveis (mesma semente = mesmos dados).
+
+    Distribui `rows` entre `users` usuários (alguns bem mais pesados que
+    outros) ao longo de `years` anos. ~15% são receitas; categorias e
+    subcategorias vêm de `categories.py`, com despesas do dia a dia mais
+    frequentes e valores log-normais em torno de uma mediana por categoria.
+    Inclui a coluna `user_id`.
+    """
+    rng = np.random.default_rng(seed)
+    user_ids = np.array([f"user{i:03d}" for i in range(users)])
+    user_weights = rng.pareto(1.5, users) + 1
+    user_col = rng.choice(user_ids, rows, p=user_weights / user_weights.sum())
+
+    inicio = end - timedelta(days=365 * years)
+    dias = rng.integers(0, (end - inicio).days + 1, rows)
+    datas = (np.datetime64(inicio) + dias.astype("timedelta64[D]")).astype(str)
+
+    receita = rng.random(rows) < 0.15
+    desp_cats = list(CATEGORIES)
+    pesos = np.array([EXPENSE_WEIGHTS.get(c, 1) for c in desp_cats], dtype=float)
+    rec_cats = list(INCOME_CATEGORIES)
+    categoria = np.where(
+        receita,
+        rng.choice(rec_cats, rows),
+        rng.choice(desp_cats, rows, p=pesos / pesos.sum()),
+    )
+
+    # Subcategoria: sorteia um índice e mapeia dentro da lista da categoria
+    taxonomia = {**CATEGORIES, **INCOME_CATEGORIES}
+    sorteio = rng.random(rows)
+    subcategoria = np.empty(rows, dtype=object)
+    for cat, subs in taxonomia.items():
+        mask = categoria == cat
+        if mask.any():
+            idx = (sorteio[mask] * len(subs)).astype(int)
+            subcategoria[mask] = np.asarray(subs, dtype=object)[idx]
+
+    mediana = np.array([CATEGORY_MEDIAN.get(c, DEFAULT_MEDIAN) for c in categoria], dtype=float)
+    valor = np.round(mediana * rng.lognormal(0, 0.6, rows), 2).clip(0.01)
+
+    return pd.DataFrame({
+        "user_id": user_col,
+        "data": datas,
+        "tipo": np.where(receita, "Receita", "Despesa"),
+        "categoria": categoria,
+        "subcategoria": subcategoria,
+        "descricao": np.char.add("Lançamento ", rng.integers(0, 10_000, rows).astype(str)),
+        "valor": valor,
+        "conta": rng.choice(CONTAS, rows),
+        "tags": rng.choice(TAGS, rows),
+    })
+
+
+def make_import_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Gera um DataFrame no formato do CSV de importação (um único usuário)."""
+    return generate_transactions(rows, users=1, seed=seed).drop(columns="user_id")
+
+
+def load_database(path: Path, df: pd.DataFrame) -> sqlite3.Connection:
+    """Cria a base em `path` (com os PRAGMAs do app) e importa `df` por usuário."""
+    conn = db.get_pool(path).get()
+    for uid, parte in df.groupby("user_id", sort=False):
+        db.bulk_insert_transactions(conn, parte.drop(columns="user_id"), uid)
+    conn.execute("PRAGMA optimize")
+    return conn
+
+
+def _time_call(fn, repeat: int) -> tuple[list[float], object]:
+    tempos, resultado = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        resultado = fn()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return tempos, resultado
+
+
+def _result_size(resultado) -> int:
+    if isinstance(resultado, pd.DataFrame):
+        return len(resultado)
+    if isinstance(resultado, db.DashboardSnapshot):
+        return len(resultado.breakdown) + len(resultado.por_subcategoria)
+    if isinstance(resultado, int):
+        return 1
+    return 0
+
+
+def query_cases(conn: sqlite3.Connection, user_id: str, end: date) -> dict:
+    """Chamadas medidas: um usuário pesado, últimos 6/12 meses, como o app faz."""
+    inicio_6m = (end.replace(day=1) - timedelta(days=150)).replace(day=1)
+    inicio_12m = date(end.year - 1, end.month, 1)
+    filtros = {
+        "user_id": user_id, "tipo": "Todos", "categoria": "Todas", "subcategoria": "Todas",
+        "data_inicio": inicio_6m, "data_fim": end, "busca": "",
+    }
+    primeira = db.get_transactions_page(conn, user_id, data_inicio=inicio_12m, data_fim=end)
+    cursor = db.page_cursor(primeira.iloc[-1]) if not primeira.empty else None
+    return {
+        "get_transactions": lambda: db.get_transactions(conn, user_id, data_inicio=inicio_6m, data_fim=end),
+        "get_transactions_busca": lambda: db.get_transactions(
+            conn, user_id, data_inicio=inicio_12m, data_fim=end, busca="mercado"
+        ),
+        "get_transactions_page": lambda: db.get_transactions_page(
+            conn, user_id, data_inicio=inicio_12m, data_fim=end, after=cursor
+        ),
+        "get_transactions_tag": lambda: db.get_transactions(
+            conn, user_id, data_inicio=inicio_12m, data_fim=end, tag="mercado"
+        ),
+        "count_transactions": lambda: db.count_transactions(conn, user_id, data_inicio=inicio_12m, data_fim=end),
+        "get_monthly_cashflow": lambda: db.get_monthly_cashflow(conn, inicio_12m, end, user_id),
+        "get_monthly_breakdown": lambda: db.get_monthly_breakdown(conn, inicio_12m, end, user_id),
+        "get_sum_by_category": lambda: db.get_sum_by_category(conn, filtros),
+        "get_sum_by_category_and_type": lambda: db.get_sum_by_category_and_type(
+            conn, user_id, inicio_12m, end, "Despesa"
+        ),
+        "get_dashboard_snapshot": lambda: db.get_dashboard_snapshot(conn, filtros),
+        "get_monthly_trends": lambda: db.get_monthly_trends(conn, user_id, inicio_12m, end),
+        "get_category_yoy": lambda: db.get_category_yoy(conn, user_id, inicio_12m, end),
+        "get_spend_by_tag": lambda: db.get_spend_by_tag(conn, user_id, inicio_12m, end),
+    }
+
+
+def bench_queries(sizes: list[int], users: int, repeat: int, seed: int) -> list[dict]:
+    end = date(2025, 12, 31)
+    resultados = []
+    for size in sizes:
+        df = generate_transactions(size, users=users, seed=seed, end=end)
+        heavy_user = df["user_id"].value_counts().index[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "bench.db"
+            t0 = time.perf_counter()
+            conn = load_database(path, df)
+            carga = time.perf_counter() - t0
+            print(f"[{size:,} linhas] carga em {carga:.1f}s; usuário medido: {heavy_user} "
+                  f"({(df['user_id'] == heavy_user).sum():,} linhas)", file=sys.stderr)
+
+            casos = query_cases(conn, heavy_user, end)
+            casos["add_transaction"] = lambda: db.add_transaction(
+                conn, end, "Despesa", "Alimentação", "Café", "bench", 9.9, "Carteira", "", heavy_user
+            )
+            for nome, fn in casos.items():
+                fn()  # aquecimento (cache de páginas)
+                tempos, resultado = _time_call(fn, repeat)
+                tempos.sort()
+                linha = {
+                    "rows": size,
+                    "function": nome,
+                    "repeat": repeat,
+                    "min_ms": round(tempos[0], 3),
+                    "median_ms": round(statistics.median(tempos), 3),
+                    "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+                    "result_rows": _result_size(resultado),
+                }
+                resultados.append(linha)
+                print(f"  {nome:<30} mediana {linha['median_ms']:>9.3f} ms  p95 {linha['p95_ms']:>9.3f} ms",
+                      file=sys.stderr)
+            db.get_pool(path).close_all()
+    return resultados
+
+
+def compare(resultados: list[dict], baseline_path: Path, threshold: float) -> list[str]:
+    """Funções cuja mediana passou de `threshold` x a da execução de referência."""
+    base = json.loads(baseline_path.read_text(encoding="utf-8"))
+    ref = {(r["rows"], r["function"]): r["median_ms"] for r in base["results"]}
+    regressoes = []
+    for r in resultados:
+        antes = ref.get((r["rows"], r["function"]))
+        # Ignora ruído abaixo de 1 ms
+        if antes and r["median_ms"] > max(antes * threshold, antes + 1):
+            regressoes.append(
+                f"{r['function']} @ {r['rows']:,}: {antes:.3f} ms -> {r['median_ms']:.3f} ms"
+            )
+    return regressoes
+
+
+def bench_import(rows: int, chunk_size: int) -> None:
+    df = make_import_frame(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(Path(tmp) / "bench.db")
+        db.init_db(conn)
+        t0 = time.perf_counter()
+        rep = db.bulk_insert_transactions(conn, df, "bench", chunk_size=chunk_size)
+        elapsed = time.perf_counter() - t0
+        conn.close()
+    print(
+        f"bulk_insert_transactions: {rep.inserted} linhas em {elapsed:.2f}s "
+        f"({rep.inserted / elapsed:,.0f} linhas/s), {len(rep.rejected)} recusadas"
+    )
+
+
+def bench_writes(sessions: int, per_session: int) -> None:
+    lancamento = dict(
+        data_lanc=date(2025, 1, 15), tipo="Despesa", categoria="Alimentação", subcategoria="Supermercado",
+        descricao="bench", valor=12.5, conta="Carteira", tags="#bench",
+    )
+    for modo in ("direto", "fila"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "bench.db"
+            tempos: list[float] = []
+            erros: list[Exception] = []
+            fila = writer.WriteQueue(lambda: db.get_pool(path).get())
+
+            def sessao(i: int) -> None:
+                uid = f"user{i:03d}"
+                for _ in range(per_session):
+                    t0 = time.perf_counter()
+                    try:
+                        if modo == "direto":
+                            db.add_transaction(db.get_pool(path).get(), user_id=uid, **lancamento)
+                        else:
+                            fila.submit(user_id=uid, **lancamento).result()
+                    except sqlite3.OperationalError as exc:  # database is locked
+                        erros.append(exc)
+                    tempos.append((time.perf_counter() - t0) * 1000)
+
+            threads = [threading.Thread(target=sessao, args=(i,)) for i in range(sessions)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            db.get_pool(path).close_all()
+        tempos.sort()
+        print(
+            f"{modo:<6} {sessions} sessões: mediana {statistics.median(tempos):7.2f} ms  "
+            f"p95 {tempos[int(len(tempos) * 0.95)]:7.2f} ms  erros {len(erros)}"
+        )
+
+
+def run_queries(args: argparse.Namespace) -> None:
+    resultados = bench_queries(args.sizes, args.users, args.repeat, args.seed)
+    saida = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "pandas": pd.__version__,
+        "seed": args.seed,
+        "users": args.users,
+        "results": resultados,
+    }
+    Path(args.out).write_text(json.dumps(saida, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Resultados gravados em {args.out}", file=sys.stderr)
+    if args.baseline:
+        regressoes = compare(resultados, Path(args.baseline), args.threshold)
+        if regressoes:
+            print("Regressões de desempenho:\n  " + "\n  ".join(regressoes), file=sys.stderr)
+            raise SystemExit(1)
+        print("Sem regressões em relação à referência.", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks do Controle Financeiro")
+    sub = parser.add_subparsers(dest="cenario", required=True)
+
+    p = sub.add_parser("import", help="Importação em lote de um CSV sintético")
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--chunk-size", type=int, default=db.IMPORT_CHUNK_SIZE)
+    p.set_defaults(func=lambda a: bench_import(a.rows, a.chunk_size))
+
+    p = sub.add_parser("writes", help="Latência de salvar com sessões simultâneas: direto x fila de escrita")
+    p.add_argument("--sessions", type=int, default=16)
+    p.add_argument("--per-session", type=int, default=50)
+    p.set_defaults(func=lambda a: bench_writes(a.sessions, a.per_session))
+
+    p = sub.add_parser("queries", help="Tempo das funções de consulta em 10k/100k/1M linhas")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--users", type=int, default=20)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+    p.add_argument("--threshold", type=float, default=1.25, help="Fator de piora tolerado (padrão 1.25)")
+    p.set_defaults(func=run_queries)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
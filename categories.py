@@ -1,5 +1,8 @@
 # Lista abrangente de categorias e subcategorias de despesas e receitas em pt-BR
 # Inclui o máximo de opções úteis para o dia a dia brasileiro
+import unicodedata
+from collections.abc import Mapping
+from types import MappingProxyType
 
 CATEGORIES = {
     "Moradia": [
@@ -209,33 +212,98 @@ INCOME_CATEGORIES = {
 }
 
 
+# ---- Estruturas pré-calculadas ----
+# Montadas uma vez no import a partir dos dicionários acima e imutáveis
+# (tuplas e MappingProxyType): podem ser compartilhadas entre sessões e
+# reruns sem cópia. Alterações na taxonomia devem ser feitas nos dicionários.
+
+
+def normalize_key(texto: str) -> str:
+    """Chave de busca: sem acentos, minúsculas e espaços colapsados ('  Açougue ' -> 'acougue')."""
+    decomposto = unicodedata.normalize("NFKD", str(texto))
+    sem_acento = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acento.casefold().split())
+
+
+def _freeze(taxonomia: dict) -> Mapping[str, tuple[str, ...]]:
+    return MappingProxyType({cat: tuple(subs) for cat, subs in taxonomia.items()})
+
+
+EXPENSE_TAXONOMY = _freeze(CATEGORIES)
+INCOME_TAXONOMY = _freeze(INCOME_CATEGORIES)
+
+EXPENSE_CATEGORY_NAMES: tuple[str, ...] = tuple(EXPENSE_TAXONOMY)
+INCOME_CATEGORY_NAMES: tuple[str, ...] = tuple(INCOME_TAXONOMY)
+# Despesas depois receitas, sem repetir nomes
+ALL_CATEGORY_NAMES: tuple[str, ...] = tuple(dict.fromkeys(EXPENSE_CATEGORY_NAMES + INCOME_CATEGORY_NAMES))
+
+# Mapa combinado categoria -> subcategorias; em nome repetido, vale o de despesas
+ALL_TAXONOMY: Mapping[str, tuple[str, ...]] = MappingProxyType({**INCOME_TAXONOMY, **EXPENSE_TAXONOMY})
+
+# Tipo de cada lançamento por taxonomia
+TAXONOMY_BY_TIPO: Mapping[str, Mapping[str, tuple[str, ...]]] = MappingProxyType(
+    {"Despesa": EXPENSE_TAXONOMY, "Receita": INCOME_TAXONOMY}
+)
+
+
+def _build_indexes():
+    categorias: dict[str, list] = {}
+    subcategorias: dict[str, list] = {}
+    pares: dict[tuple[str, str], list] = {}
+    for tipo, taxonomia in TAXONOMY_BY_TIPO.items():
+        for cat, subs in taxonomia.items():
+            categorias.setdefault(normalize_key(cat), []).append((tipo, cat))
+            for sub in subs:
+                subcategorias.setdefault(normalize_key(sub), []).append((tipo, cat))
+                pares.setdefault((normalize_key(cat), normalize_key(sub)), []).append((tipo, cat, sub))
+
+    def freeze(index: dict) -> Mapping:
+        return MappingProxyType({k: tuple(v) for k, v in index.items()})
+
+    return freeze(categorias), freeze(subcategorias), freeze(pares)
+
+
+# Índices reversos com chaves normalizadas (normalize_key). Os valores são
+# tuplas porque um nome pode existir em mais de um lugar (ex.: 'Juros').
+#   CATEGORY_INDEX:    'alimentacao' -> (('Despesa', 'Alimentação'),)
+#   SUBCATEGORY_INDEX: 'acougue' -> (('Despesa', 'Alimentação'),)
+#   PAIR_INDEX:        ('alimentacao', 'acougue') -> (('Despesa', 'Alimentação', 'Açougue'),)
+CATEGORY_INDEX, SUBCATEGORY_INDEX, PAIR_INDEX = _build_indexes()
+
+
+def find_subcategory(nome: str) -> tuple[tuple[str, str], ...]:
+    """(tipo, categoria) de cada categoria que tem a subcategoria `nome` (ignora acentos/maiúsculas)."""
+    return SUBCATEGORY_INDEX.get(normalize_key(nome), ())
+
+
+def find_category(nome: str) -> tuple[tuple[str, str], ...]:
+    """(tipo, nome canônico) das categorias que casam com `nome` (ignora acentos/maiúsculas)."""
+    return CATEGORY_INDEX.get(normalize_key(nome), ())
+
+
 def get_categories():
     # Apenas chaves; o app decide o uso conforme 'tipo'
-    return list(CATEGORIES.keys())
+    return EXPENSE_CATEGORY_NAMES
 
 
 def get_subcategories(categoria: str):
-    return CATEGORIES.get(categoria, [])
+    return EXPENSE_TAXONOMY.get(categoria, ())
 
 
 # ---- Novas funções para receitas e visão combinada ----
 def get_income_categories():
-    return list(INCOME_CATEGORIES.keys())
+    return INCOME_CATEGORY_NAMES
 
 
 def get_income_subcategories(categoria: str):
-    return INCOME_CATEGORIES.get(categoria, [])
+    return INCOME_TAXONOMY.get(categoria, ())
 
 
 def get_all_categories():
     # União de chaves de despesas e receitas, mantendo ordem aproximada: despesas depois receitas
-    return list(CATEGORIES.keys()) + [c for c in INCOME_CATEGORIES.keys() if c not in CATEGORIES]
+    return ALL_CATEGORY_NAMES
 
 
 def get_any_subcategories(categoria: str):
     # Busca subcategorias em despesas; se não achar, busca em receitas
-    if categoria in CATEGORIES:
-        return CATEGORIES[categoria]
-    if categoria in INCOME_CATEGORIES:
-        return INCOME_CATEGORIES[categoria]
-    return []
+    return ALL_TAXONOMY.get(categoria, ())
@@ -1,41 +1,394 @@
+import csv
+import difflib
+import hashlib
+import io
+import json
+import os
+import re
 import sqlite3
+import zlib
+from decimal import Decimal, ROUND_HALF_UP
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Iterator, Optional
 import pandas as pd
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+
+from categories import PAIR_INDEX, TAXONOMY_BY_TIPO, find_subcategory, normalize_key
 
 DB_PATH = Path(__file__).with_name("finance.db")
 
+# Modo opcional de um arquivo por usuário: FINANCE_SHARDS_DIR com uma ou mais
+# pastas (separadas por os.pathsep, ex.: discos diferentes). Vazio = todos os
+# usuários em DB_PATH. A pasta de cada usuário é fixa (hash do user_id): não
+# mude a ordem/quantidade de pastas depois de criar os arquivos.
+SHARDS_DIRS = [Path(p) for p in os.environ.get("FINANCE_SHARDS_DIR", "").split(os.pathsep) if p.strip()]
+
+# Máximo de pools de arquivos de usuário abertos ao mesmo tempo (LRU)
+MAX_OPEN_SHARDS = 64
+
+# Índice de texto (FTS5) para o filtro `busca`; definido por init_db conforme o
+# SQLite em uso tenha o módulo fts5. Sem ele, a busca volta a usar LIKE.
+FTS_ENABLED = False
+
+# Versão do esquema gravada em PRAGMA user_version; cada migração sobe este número.
+SCHEMA_VERSION = 9
+
+# Dinheiro é gravado só em centavos inteiros (`valor_centavos`, convertidos por
+# to_cents); somas são feitas em inteiros e convertidas para reais só na borda
+# (DataFrames devolvidos).
+
+
+# PRAGMAs aplicados a toda conexão do pool. WAL deixa leitores de outras
+# sessões seguirem durante uma escrita; NORMAL é seguro com WAL (só faz fsync
+# no checkpoint).
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,             # ms esperando o lock de escrita antes de falhar
+    "mmap_size": 256 * 1024 * 1024,   # leituras via mmap (até 256 MiB)
+    "cache_size": -32000,             # negativo = KiB (~32 MiB de page cache)
+    "temp_store": "MEMORY",           # GROUP BY/ORDER BY temporários em memória
+}
+
+
+# Classe das conexões do pool; diagnostics.enable() troca por uma instrumentada
+CONNECTION_FACTORY = sqlite3.Connection
+
+
+def _configure(conn: sqlite3.Connection) -> None:
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    _register_functions(conn)
+
+
+def _register_functions(conn: sqlite3.Connection) -> None:
+    # Funções SQL usadas pelos gatilhos (ver transacao_tags_au); precisam existir
+    # em toda conexão que altere `transacoes`
+    conn.create_function("tags_json", 1, lambda texto: json.dumps(parse_tags(texto)), deterministic=True)
+
+
+class ConnectionPool:
+    """Pool de conexões por processo, ciente de threads.
+
+    O Streamlit roda cada rerun em uma thread. Cada thread recebe uma conexão
+    exclusiva; quando a thread termina, a conexão volta para o pool e é
+    reaproveitada pelo próximo rerun (de qualquer sessão). Nunca há duas
+    threads usando a mesma conexão ao mesmo tempo.
+    """
+
+    def __init__(self, path, max_idle: int = 8):
+        self.path = path
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: list[sqlite3.Connection] = []
+        self._owners: dict[int, tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._initialized = False
+        # Threads entre escolher este pool e receber a conexão (protegido por _POOLS_LOCK)
+        self.pins = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=CONNECTION_FACTORY)
+        conn.row_factory = sqlite3.Row
+        _configure(conn)
+        return conn
+
+    def _reclaim(self) -> None:
+        # Devolve ao pool as conexões de threads que já terminaram
+        for ident, (thread, conn) in list(self._owners.items()):
+            if not thread.is_alive():
+                del self._owners[ident]
+                self._checkin(conn)
+
+    def _checkin(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if len(self._idle) < self.max_idle:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    def get(self) -> sqlite3.Connection:
+        thread = threading.current_thread()
+        with self._lock:
+            owned = self._owners.get(thread.ident)
+            if owned and owned[0] is thread:
+                return owned[1]
+            self._reclaim()
+            conn = self._idle.pop() if self._idle else self._open()
+            if not self._initialized:
+                # Migrações rodam uma vez por processo, não a cada rerun
+                init_db(conn)
+                self._initialized = True
+            self._owners[thread.ident] = (thread, conn)
+            return conn
+
+    def release(self) -> None:
+        """Devolve explicitamente a conexão da thread atual (uso fora do Streamlit)."""
+        with self._lock:
+            owned = self._owners.pop(threading.get_ident(), None)
+            if owned:
+                self._checkin(owned[1])
+
+    def close_idle(self) -> bool:
+        """Fecha as conexões ociosas; retorna se nenhuma thread usa o pool."""
+        with self._lock:
+            self._reclaim()
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            return not self._owners
+
+    def close_all(self) -> None:
+        with self._lock:
+            for _, conn in self._owners.values():
+                conn.close()
+            for conn in self._idle:
+                conn.close()
+            self._owners.clear()
+            self._idle.clear()
+            self._initialized = False
+
+
+_POOLS: dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+# Pools dos arquivos de usuário, do menos para o mais recente (LRU)
+_SHARD_POOLS: dict[str, ConnectionPool] = {}
+
+
+def get_pool(path=None) -> ConnectionPool:
+    key = str(path or DB_PATH)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ConnectionPool(key)
+        return pool
+
+
+def shard_path(user_id: str) -> Path:
+    """Arquivo do usuário no modo um-arquivo-por-usuário (não cria nada)."""
+    if not SHARDS_DIRS:
+        raise RuntimeError("FINANCE_SHARDS_DIR não configurado")
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    # Nome legível + hash: ids diferentes nunca caem no mesmo arquivo
+    slug = re.sub(r"[^\w.-]", "_", user_id)[:40]
+    return SHARDS_DIRS[int(digest, 16) % len(SHARDS_DIRS)] / f"{slug}-{digest[:12]}.db"
+
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def _shard_pool(user_id: str) -> ConnectionPool:
+    """Pool do arquivo do usuário, já fixado (`pins`); solte com _unpin depois do get()."""
+    key = str(shard_path(user_id))
+    with _POOLS_LOCK:
+        pool = _SHARD_POOLS.pop(key, None)
+        if pool is None:
+            # Criação preguiçosa: o arquivo (e o esquema) só surgem na primeira conexão
+            Path(key).parent.mkdir(parents=True, exist_ok=True)
+            pool = ConnectionPool(key, max_idle=2)
+        _SHARD_POOLS[key] = pool
+        pool.pins += 1
+        # Fecha os menos usados; pools fixados ou com conexão em uso por alguma thread ficam
+        for old_key in list(_SHARD_POOLS):
+            if len(_SHARD_POOLS) <= MAX_OPEN_SHARDS:
+                break
+            old = _SHARD_POOLS[old_key]
+            if not old.pins and old.close_idle():
+                del _SHARD_POOLS[old_key]
+        return pool
+
+
+def _unpin(pool: ConnectionPool) -> None:
+    with _POOLS_LOCK:
+        pool.pins -= 1
+
+
+def get_connection(user_id: Optional[str] = None) -> sqlite3.Connection:
+    """Conexão do pool para a thread atual, com esquema já inicializado.
+
+    Com FINANCE_SHARDS_DIR, `user_id` escolhe o arquivo do usuário; sem ele
+    (ou sem usuário), a conexão é do banco compartilhado DB_PATH.
+    """
+    if SHARDS_DIRS and user_id:
+        # A conexão é retirada com o pool fixado: a LRU não o fecha no meio do caminho
+        pool = _shard_pool(user_id)
+        try:
+            return pool.get()
+        finally:
+            _unpin(pool)
+    return get_pool().get()
+
+
+def release_connection(user_id: Optional[str] = None) -> None:
+    """Devolve ao pool a conexão da thread atual obtida com get_connection(user_id).
+
+    Para laços fora do Streamlit que passam por muitos usuários: sem isso, a
+    thread segura um arquivo de cada um e a LRU não consegue fechar nenhum.
+    """
+    if SHARDS_DIRS and user_id:
+        with _POOLS_LOCK:
+            pool = _SHARD_POOLS.get(str(shard_path(user_id)))
+        if pool is not None:
+            pool.release()
+        return
+    get_pool().release()
+
+
+def _shard_is_empty(user_id: str) -> bool:
+    try:
+        return get_connection(user_id).execute("SELECT 1 FROM transacoes LIMIT 1").fetchone() is None
+    finally:
+        release_connection(user_id)
+
+
+def split_into_shards(conn: sqlite3.Connection, users: Optional[list] = None) -> dict[str, int]:
+    """Copia os lançamentos de cada usuário do banco compartilhado para o arquivo dele.
+
+    Leva transações (com os mesmos ids), tags, metas, versão dos dados e
+    pontos de retomada de importação; categorias são remapeadas pelo nome, e resumo
+    mensal e índice de busca são montados pelos gatilhos do arquivo novo.
+    Os arquivos de destino precisam estar sem lançamentos (os ids são mantidos):
+    rode antes de usar o app no modo por arquivo. Se algum já tiver, nada é
+    copiado e sobe RuntimeError. O banco compartilhado não é alterado.
+    Retorna {user_id: linhas copiadas}.
+    """
+    if not SHARDS_DIRS:
+        raise RuntimeError("FINANCE_SHARDS_DIR não configurado")
+    origem = conn.execute("PRAGMA database_list").fetchone()[2]
+    if users is None:
+        users = [r[0] for r in conn.execute(
+            "SELECT DISTINCT user_id FROM transacoes WHERE user_id IS NOT NULL AND user_id <> '' ORDER BY 1"
+        )]
+    ocupados = [uid for uid in users if not _shard_is_empty(uid)]
+    if ocupados:
+        raise RuntimeError(
+            "Arquivo(s) de usuário já com lançamentos: " + ", ".join(ocupados)
+            + ". A divisão só copia para arquivos vazios (use --user para os demais)."
+        )
+    copied = {}
+    for uid in users:
+        esperado = conn.execute("SELECT COUNT(*) FROM transacoes WHERE user_id = ?", (uid,)).fetchone()[0]
+        dest = get_connection(uid)
+        dest.execute("ATTACH DATABASE ? AS origem", (origem,))
+        try:
+            with dest:
+                dest.execute(
+                    """
+                    INSERT OR IGNORE INTO categorias (tipo, categoria, subcategoria)
+                    SELECT DISTINCT c.tipo, c.categoria, c.subcategoria
+                    FROM origem.transacoes t JOIN origem.categorias c USING (categoria_id)
+                    WHERE t.user_id = ?
+                    """,
+                    (uid,),
+                )
+                cur = dest.execute(
+                    """
+                    INSERT INTO transacoes
+                        (id, data, categoria_id, descricao, conta, tags, user_id, valor_centavos, impressao)
+                    SELECT t.id, t.data, n.categoria_id, t.descricao, t.conta, t.tags, t.user_id,
+                        t.valor_centavos, t.impressao
+                    FROM origem.transacoes t
+                    JOIN origem.categorias c USING (categoria_id)
+                    JOIN categorias n ON n.tipo = c.tipo AND n.categoria = c.categoria AND n.subcategoria = c.subcategoria
+                    WHERE t.user_id = ?
+                    """,
+                    (uid,),
+                )
+                if cur.rowcount != esperado:
+                    # Desfaz o usuário inteiro (saída do `with`)
+                    raise RuntimeError(f"{uid}: {cur.rowcount} de {esperado} lançamentos copiados")
+                copied[uid] = cur.rowcount
+                dest.execute(
+                    """
+                    INSERT OR IGNORE INTO transacao_tags (transacao_id, tag)
+                    SELECT g.transacao_id, g.tag FROM origem.transacao_tags g
+                    JOIN origem.transacoes t ON t.id = g.transacao_id
+                    WHERE t.user_id = ?
+                    """,
+                    (uid,),
+                )
+                dest.execute(
+                    "INSERT OR IGNORE INTO importacoes SELECT * FROM origem.importacoes WHERE user_id = ?", (uid,)
+                )
+                dest.execute("INSERT OR IGNORE INTO metas SELECT * FROM origem.metas WHERE user_id = ?", (uid,))
+                dest.execute(
+                    """
+                    INSERT OR IGNORE INTO importacoes_ocorrencias
+                    SELECT o.* FROM origem.importacoes_ocorrencias o
+                    JOIN origem.importacoes i USING (importacao_id) WHERE i.user_id = ?
+                    """,
+                    (uid,),
+                )
+                # Versão acima da do banco compartilhado: caches de sessão não reaproveitam nada
+                versao = conn.execute("SELECT versao FROM versoes_dados WHERE user_id = ?", (uid,)).fetchone()
+                dest.execute(
+                    """
+                    INSERT INTO versoes_dados (user_id, versao) VALUES (?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET versao = max(versao, excluded.versao)
+                    """,
+                    (uid, (versao[0] if versao else 0) + 1),
+                )
+        finally:
+            dest.execute("DETACH DATABASE origem")
+            # Cada arquivo volta ao pool: a LRU mantém no máximo MAX_OPEN_SHARDS abertos
+            release_connection(uid)
+    return copied
+
+
+# Colunas de transacoes (a partir da v4); usado na criação e na migração
+_TRANSACOES_DDL = """
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data TEXT NOT NULL,              -- YYYY-MM-DD
+        categoria_id INTEGER NOT NULL REFERENCES categorias(categoria_id),
+        descricao TEXT,
+        conta TEXT,
+        tags TEXT,
+        user_id TEXT,                    -- identificador do usuário (multi-tenant)
+        valor_centavos INTEGER NOT NULL, -- valor positivo em centavos
+        impressao INTEGER                -- impressão digital do conteúdo (importações); ver _fingerprints
+    )
+"""
 
 
 def init_db(conn: sqlite3.Connection) -> None:
+    _register_functions(conn)
     cur = conn.cursor()
+    # Dimensão de categorias: cada (tipo, categoria, subcategoria) vira um id
+    # inteiro, referenciado por transacoes e resumo_mensal
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS transacoes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data TEXT NOT NULL,              -- YYYY-MM-DD
+        CREATE TABLE IF NOT EXISTS categorias (
+            categoria_id INTEGER PRIMARY KEY,
             tipo TEXT NOT NULL,              -- 'Despesa' ou 'Receita'
             categoria TEXT NOT NULL,
             subcategoria TEXT NOT NULL,
-            descricao TEXT,
-            valor REAL NOT NULL,             -- valor positivo
-            conta TEXT,
-            tags TEXT,
-            user_id TEXT                     -- identificador do usuário (multi-tenant)
+            UNIQUE (tipo, categoria, subcategoria)
         )
         """
     )
+    _seed_categories(cur)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS transacoes {_TRANSACOES_DDL}")
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
     # Migração leve: adicionar coluna user_id se não existir
     cur.execute("PRAGMA table_info(transacoes)")
     cols = [r[1] for r in cur.fetchall()]
     if "user_id" not in cols:
         cur.execute("ALTER TABLE transacoes ADD COLUMN user_id TEXT")
+    if "valor_centavos" not in cols:
+        # Linhas antigas ficam NULL e são convertidas na reconstrução abaixo
+        cur.execute("ALTER TABLE transacoes ADD COLUMN valor_centavos INTEGER")
+    if "impressao" not in cols:
+        # v5: linhas anteriores ficam sem impressão (ver backfill_fingerprints)
+        cur.execute("ALTER TABLE transacoes ADD COLUMN impressao INTEGER")
+    if "valor" in cols:
+        # Reconstruções abaixo: centavos que faltam vêm do `valor` REAL por to_cents
+        conn.create_function("to_cents", 1, to_cents, deterministic=True)
+    if "categoria_id" not in cols:
+        # v4: tipo/categoria/subcategoria TEXT -> categoria_id
+        _migrate_categories(cur)
+    elif "valor" in cols:
+        # v9: sem a coluna `valor` REAL (espelho de valor_centavos)
+        _drop_legacy_valor(cur)
     cur.execute(
         """
         CREATE INDEX IF NOT EXISTS idx_transacoes_data ON transacoes(data)
@@ -43,38 +396,565 @@ def init_db(conn: sqlite3.Connection) -> None:
     )
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_transacoes_tipo ON transacoes(tipo)
+        CREATE INDEX IF NOT EXISTS idx_transacoes_user ON transacoes(user_id)
         """
     )
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_transacoes_categoria ON transacoes(categoria)
+        CREATE INDEX IF NOT EXISTS idx_transacoes_user_data ON transacoes(user_id, data)
         """
     )
+    # Importações idempotentes: uma linha por conteúdo (lançamentos manuais ficam NULL)
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_transacoes_user ON transacoes(user_id)
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transacoes_impressao ON transacoes(impressao)
+        WHERE impressao IS NOT NULL
         """
     )
+    # Versão dos dados por usuário: incrementada a cada escrita, invalida caches de leitura
     cur.execute(
         """
-        CREATE INDEX IF NOT EXISTS idx_transacoes_user_data ON transacoes(user_id, data)
+        CREATE TABLE IF NOT EXISTS versoes_dados (
+            user_id TEXT PRIMARY KEY,        -- '' para lançamentos sem usuário
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Importações em blocos (import_csv_stream): ponto de retomada por arquivo e
+    # contagem de ocorrências de cada conteúdo, para os ordinais da impressão digital
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS importacoes (
+            importacao_id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,           -- '' para lançamentos sem usuário
+            arquivo_hash TEXT NOT NULL,      -- sha256 do arquivo
+            nome TEXT,
+            linhas INTEGER NOT NULL DEFAULT 0,    -- linhas de dados já gravadas (retomada)
+            inseridas INTEGER NOT NULL DEFAULT 0,
+            duplicadas INTEGER NOT NULL DEFAULT 0,
+            recusadas INTEGER NOT NULL DEFAULT 0,
+            concluida INTEGER NOT NULL DEFAULT 0,
+            atualizado_em TEXT NOT NULL,
+            UNIQUE (user_id, arquivo_hash)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS importacoes_ocorrencias (
+            importacao_id INTEGER NOT NULL,
+            conteudo INTEGER NOT NULL,       -- hash do conteúdo sem ordinal
+            qtd INTEGER NOT NULL,
+            PRIMARY KEY (importacao_id, conteudo)
+        ) WITHOUT ROWID
+        """
+    )
+    # Tags normalizadas (sem '#', minúsculas): uma linha por lançamento e tag,
+    # gravadas junto com o lançamento (_write_tags / _insert_valid)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transacao_tags (
+            transacao_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (transacao_id, tag)
+        ) WITHOUT ROWID
+        """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transacao_tags_tag ON transacao_tags(tag, transacao_id)")
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transacao_tags_ad AFTER DELETE ON transacoes BEGIN
+            DELETE FROM transacao_tags WHERE transacao_id = old.id;
+        END
+        """
+    )
+    # Edição do texto de `tags`: refaz as tags da linha (parse_tags via tags_json)
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transacao_tags_au AFTER UPDATE OF tags ON transacoes BEGIN
+            DELETE FROM transacao_tags WHERE transacao_id = old.id;
+            INSERT OR IGNORE INTO transacao_tags (transacao_id, tag)
+            SELECT new.id, value FROM json_each(tags_json(new.tags));
+        END
+        """
+    )
+    # Metas dos avisos por usuário: fração da receita do mês por categoria de
+    # despesa (teto) e, com categoria '', a poupança mínima
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metas (
+            user_id TEXT NOT NULL,           -- '' para lançamentos sem usuário
+            categoria TEXT NOT NULL,
+            alvo REAL NOT NULL,
+            PRIMARY KEY (user_id, categoria)
+        ) WITHOUT ROWID
+        """
+    )
+    # Avisos já calculados por usuário e mês, válidos enquanto versoes_mes não mudar
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS avisos_mes (
+            user_id TEXT NOT NULL,
+            ym TEXT NOT NULL,
+            versao INTEGER NOT NULL,         -- versoes_mes.versao usada no cálculo
+            avisos TEXT NOT NULL,            -- JSON
+            PRIMARY KEY (user_id, ym)
+        ) WITHOUT ROWID
         """
     )
+    _init_month_versions(cur)
+    _init_fts(cur)
+    if 0 < version < 4:
+        # Resumo mensal antigo: `total` REAL (até a v2) e chave em TEXT (até a v3)
+        for trigger in ("resumo_mensal_ai", "resumo_mensal_ad", "resumo_mensal_au"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute("DROP TABLE IF EXISTS resumo_mensal")
+    _init_rollup(cur)
+    if version < 1:
+        # Contrato de armazenamento: `data` é sempre TEXT 'YYYY-MM-DD'.
+        # Normaliza linhas antigas (ex.: '2025-01-31 00:00:00') para que as
+        # consultas comparem a coluna crua e usem idx_transacoes_user_data.
+        cur.execute(
+            """
+            UPDATE transacoes SET data = date(data)
+            WHERE date(data) IS NOT NULL AND data <> date(data)
+            """
+        )
+    if version < 9:
+        # Popula o resumo mensal (em centavos, por categoria_id) com o histórico
+        # existente; na v9, também os centavos convertidos na reconstrução
+        _rebuild_rollup(cur)
+    if version < 7:
+        # Tags dos lançamentos existentes, a partir do texto livre de `tags`
+        _backfill_tags(cur)
+    if version < SCHEMA_VERSION:
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
 
 
+def _seed_categories(cur: sqlite3.Cursor) -> None:
+    # Taxonomia de categories.py; ids estáveis (INSERT OR IGNORE não renumera)
+    rows = [
+        (tipo, categoria, subcategoria)
+        for tipo, taxonomia in TAXONOMY_BY_TIPO.items()
+        for categoria, subcategorias in taxonomia.items()
+        for subcategoria in subcategorias
+    ]
+    cur.executemany(
+        "INSERT OR IGNORE INTO categorias (tipo, categoria, subcategoria) VALUES (?, ?, ?)", rows
+    )
+
+
+def _migrate_categories(cur: sqlite3.Cursor) -> None:
+    """Reconstrói transacoes trocando tipo/categoria/subcategoria por categoria_id.
+
+    Os ids das transações são mantidos (o índice FTS continua válido); gatilhos
+    e índices da tabela antiga somem com ela e são recriados por init_db. O
+    `valor` REAL fica para trás (ver _drop_legacy_valor).
+    """
+    cur.execute(
+        """
+        INSERT OR IGNORE INTO categorias (tipo, categoria, subcategoria)
+        SELECT DISTINCT tipo, categoria, subcategoria FROM transacoes
+        """
+    )
+    cur.execute("DROP TABLE IF EXISTS transacoes_v4")
+    cur.execute(f"CREATE TABLE transacoes_v4 {_TRANSACOES_DDL}")
+    cur.execute(
+        """
+        INSERT INTO transacoes_v4 (id, data, categoria_id, descricao, conta, tags, user_id, valor_centavos, impressao)
+        SELECT t.id, t.data, c.categoria_id, t.descricao, t.conta, t.tags, t.user_id,
+            COALESCE(t.valor_centavos, to_cents(t.valor)), t.impressao
+        FROM transacoes t
+        JOIN categorias c ON c.tipo = t.tipo AND c.categoria = t.categoria AND c.subcategoria = t.subcategoria
+        """
+    )
+    cur.execute("DROP TABLE transacoes")
+    cur.execute("ALTER TABLE transacoes_v4 RENAME TO transacoes")
+
+
+def _drop_legacy_valor(cur: sqlite3.Cursor) -> None:
+    """Reconstrói transacoes sem `valor` REAL, com valor_centavos NOT NULL.
+
+    Linhas ainda sem centavos são convertidas por to_cents (o mesmo
+    arredondamento dos lançamentos e das importações). Ids mantidos, como em
+    _migrate_categories.
+    """
+    cur.execute("DROP TABLE IF EXISTS transacoes_v9")
+    cur.execute(f"CREATE TABLE transacoes_v9 {_TRANSACOES_DDL}")
+    cur.execute(
+        """
+        INSERT INTO transacoes_v9 (id, data, categoria_id, descricao, conta, tags, user_id, valor_centavos, impressao)
+        SELECT id, data, categoria_id, descricao, conta, tags, user_id,
+            COALESCE(valor_centavos, to_cents(valor)), impressao
+        FROM transacoes
+        """
+    )
+    cur.execute("DROP TABLE transacoes")
+    cur.execute("ALTER TABLE transacoes_v9 RENAME TO transacoes")
+
+
+def _category_ids(conn: sqlite3.Connection, combos: pd.DataFrame) -> pd.Series:
+    """categoria_id de cada linha de `combos` (tipo, categoria, subcategoria).
+
+    Combinações fora da taxonomia são criadas na dimensão. Vetorizado: uma
+    inserção das combinações distintas e um merge.
+    """
+    keys = ["tipo", "categoria", "subcategoria"]
+    distinct = combos[keys].drop_duplicates()
+    conn.executemany(
+        "INSERT OR IGNORE INTO categorias (tipo, categoria, subcategoria) VALUES (?, ?, ?)",
+        distinct.astype(object).itertuples(index=False, name=None),
+    )
+    dim = pd.read_sql_query("SELECT categoria_id, tipo, categoria, subcategoria FROM categorias", conn)
+    ids = combos[keys].astype(object).merge(dim, on=keys, how="left")["categoria_id"]
+    ids.index = combos.index
+    return ids
+
+
+def _init_fts(cur: sqlite3.Cursor) -> None:
+    """Cria o índice FTS5 sobre descricao/conta/tags e os gatilhos de sincronização."""
+    global FTS_ENABLED
+    existed = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transacoes_fts'"
+    ).fetchone()
+    try:
+        # Tabela de conteúdo externo: o texto fica só em `transacoes`.
+        # remove_diacritics 2 faz 'acai' casar com 'Açaí' (e ignora maiúsculas).
+        cur.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS transacoes_fts USING fts5(
+                descricao, conta, tags,
+                content='transacoes', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # SQLite compilado sem FTS5: mantém o caminho LIKE
+        FTS_ENABLED = False
+        return
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transacoes_fts_ai AFTER INSERT ON transacoes BEGIN
+            INSERT INTO transacoes_fts (rowid, descricao, conta, tags)
+            VALUES (new.id, new.descricao, new.conta, new.tags);
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transacoes_fts_ad AFTER DELETE ON transacoes BEGIN
+            INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, conta, tags)
+            VALUES ('delete', old.id, old.descricao, old.conta, old.tags);
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transacoes_fts_au AFTER UPDATE OF descricao, conta, tags ON transacoes BEGIN
+            INSERT INTO transacoes_fts (transacoes_fts, rowid, descricao, conta, tags)
+            VALUES ('delete', old.id, old.descricao, old.conta, old.tags);
+            INSERT INTO transacoes_fts (rowid, descricao, conta, tags)
+            VALUES (new.id, new.descricao, new.conta, new.tags);
+        END
+        """
+    )
+    if not existed:
+        # Primeira criação: indexa as linhas já existentes
+        cur.execute("INSERT INTO transacoes_fts (transacoes_fts) VALUES ('rebuild')")
+    FTS_ENABLED = True
+
+
+# Colunas que definem a linha do resumo mensal de uma transação
+_ROLLUP_KEY = "COALESCE({r}.user_id, ''), substr({r}.data, 1, 7), {r}.categoria_id"
+
+
+def _init_rollup(cur: sqlite3.Cursor) -> None:
+    """Cria o resumo mensal (somas e contagens) e os gatilhos que o mantêm em dia."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resumo_mensal (
+            user_id TEXT NOT NULL,           -- '' para lançamentos sem usuário
+            ym TEXT NOT NULL,                -- YYYY-MM
+            categoria_id INTEGER NOT NULL,   -- categorias(categoria_id): tipo, categoria e subcategoria
+            total_centavos INTEGER NOT NULL,
+            qtd INTEGER NOT NULL,
+            PRIMARY KEY (user_id, ym, categoria_id)
+        ) WITHOUT ROWID
+        """
+    )
+    add_new = f"""
+        INSERT INTO resumo_mensal (user_id, ym, categoria_id, total_centavos, qtd)
+        VALUES ({_ROLLUP_KEY.format(r="new")}, new.valor_centavos, 1)
+        ON CONFLICT (user_id, ym, categoria_id)
+        DO UPDATE SET total_centavos = total_centavos + excluded.total_centavos, qtd = qtd + 1;
+    """
+    remove_old = f"""
+        UPDATE resumo_mensal SET total_centavos = total_centavos - old.valor_centavos, qtd = qtd - 1
+        WHERE (user_id, ym, categoria_id) = ({_ROLLUP_KEY.format(r="old")});
+        DELETE FROM resumo_mensal
+        WHERE (user_id, ym, categoria_id) = ({_ROLLUP_KEY.format(r="old")}) AND qtd <= 0;
+    """
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS resumo_mensal_ai AFTER INSERT ON transacoes BEGIN {add_new} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS resumo_mensal_ad AFTER DELETE ON transacoes BEGIN {remove_old} END")
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS resumo_mensal_au "
+        "AFTER UPDATE OF data, categoria_id, valor_centavos, user_id ON transacoes "
+        f"BEGIN {remove_old} {add_new} END"
+    )
+
+
+def _init_month_versions(cur: sqlite3.Cursor) -> None:
+    """Versão por usuário e mês, incrementada por gatilho a cada mudança nos lançamentos do mês."""
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS versoes_mes (
+            user_id TEXT NOT NULL,           -- '' para lançamentos sem usuário
+            ym TEXT NOT NULL,
+            versao INTEGER NOT NULL,
+            PRIMARY KEY (user_id, ym)
+        ) WITHOUT ROWID
+        """
+    )
+    bump = """
+        INSERT INTO versoes_mes (user_id, ym, versao) VALUES (COALESCE({r}.user_id, ''), substr({r}.data, 1, 7), 1)
+        ON CONFLICT (user_id, ym) DO UPDATE SET versao = versao + 1;
+    """
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS versoes_mes_ai AFTER INSERT ON transacoes BEGIN {bump.format(r='new')} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS versoes_mes_ad AFTER DELETE ON transacoes BEGIN {bump.format(r='old')} END")
+    cur.execute(
+        "CREATE TRIGGER IF NOT EXISTS versoes_mes_au "
+        "AFTER UPDATE OF data, categoria_id, valor_centavos, user_id ON transacoes "
+        f"BEGIN {bump.format(r='old')} {bump.format(r='new')} END"
+    )
+
+
+def _rebuild_rollup(cur: sqlite3.Cursor) -> None:
+    cur.execute("DELETE FROM resumo_mensal")
+    # Avisos em cache foram calculados sobre o resumo antigo
+    cur.execute("DELETE FROM avisos_mes")
+    cur.execute(
+        f"""
+        INSERT INTO resumo_mensal (user_id, ym, categoria_id, total_centavos, qtd)
+        SELECT {_ROLLUP_KEY.format(r="t")}, SUM(t.valor_centavos), COUNT(*)
+        FROM transacoes t
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def rebuild_rollup(conn: sqlite3.Connection) -> int:
+    """Recalcula o resumo mensal a partir de `transacoes`. Retorna o nº de linhas."""
+    with conn:
+        cur = conn.cursor()
+        _rebuild_rollup(cur)
+        return cur.execute("SELECT COUNT(*) FROM resumo_mensal").fetchone()[0]
+
+
+def check_rollup(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Compara o resumo mensal com a agregação crua; retorna as linhas divergentes.
+
+    DataFrame vazio = resumo consistente.
+    """
+    sql = """
+        WITH cru AS (
+            SELECT COALESCE(user_id, '') AS user_id, substr(data, 1, 7) AS ym, categoria_id,
+                   SUM(valor_centavos) AS total_centavos, COUNT(*) AS qtd
+            FROM transacoes GROUP BY 1, 2, 3
+        ), chaves AS (
+            SELECT user_id, ym, categoria_id FROM cru
+            UNION
+            SELECT user_id, ym, categoria_id FROM resumo_mensal
+        )
+        SELECT k.user_id, k.ym, c.tipo, c.categoria, c.subcategoria,
+               r.total_centavos AS centavos_resumo, cr.total_centavos AS centavos_cru,
+               r.qtd AS qtd_resumo, cr.qtd AS qtd_cru
+        FROM chaves k
+        LEFT JOIN categorias c USING (categoria_id)
+        LEFT JOIN resumo_mensal r USING (user_id, ym, categoria_id)
+        LEFT JOIN cru cr USING (user_id, ym, categoria_id)
+        WHERE r.qtd IS NOT cr.qtd OR r.total_centavos IS NOT cr.total_centavos
+    """
+    return pd.read_sql_query(sql, conn)
+
+
+def _fts_query(busca: str) -> str:
+    # Cada palavra vira um prefixo entre aspas ("merc"*), combinadas com AND.
+    # As aspas impedem que a entrada do usuário seja lida como sintaxe FTS.
+    tokens = re.findall(r"\w+", busca)
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _add_busca(sql: list, params: list, busca: Optional[str]) -> None:
+    if not busca:
+        return
+    match = _fts_query(busca) if FTS_ENABLED else ""
+    if match:
+        sql.append("AND id IN (SELECT rowid FROM transacoes_fts WHERE transacoes_fts MATCH ?)")
+        params.append(match)
+    else:
+        # Fallback (sem FTS5 ou busca só com símbolos): varredura com LIKE
+        sql.append("AND (descricao LIKE ? OR conta LIKE ? OR tags LIKE ?)")
+        like = f"%{busca}%"
+        params.extend([like, like, like])
+
+
+def _add_tag_filter(sql: list, params: list, tag: Optional[str]) -> None:
+    # Busca no índice (tag, transacao_id) em vez de LIKE sobre o texto de `tags`;
+    # com várias tags, o lançamento precisa ter todas
+    for t in parse_tags(tag):
+        sql.append("AND id IN (SELECT transacao_id FROM transacao_tags WHERE tag = ?)")
+        params.append(t)
+
+
+def _add_category_filter(
+    sql: list,
+    params: list,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+) -> None:
+    # Filtros de tipo/categoria/subcategoria resolvidos na dimensão: a tabela
+    # filtrada compara só o inteiro categoria_id
+    conds, values = [], []
+    for col, value in (("tipo", tipo), ("categoria", categoria), ("subcategoria", subcategoria)):
+        if value:
+            conds.append(f"{col} = ?")
+            values.append(value)
+    if conds:
+        sql.append(f"AND categoria_id IN (SELECT categoria_id FROM categorias WHERE {' AND '.join(conds)})")
+        params.extend(values)
+
+
+def _as_category(df: pd.DataFrame, cols: tuple = ("tipo", "categoria", "subcategoria")) -> pd.DataFrame:
+    # Colunas de dimensão como dtype `category`: menos memória e group-bys por código
+    for col in cols:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
 def _to_iso(d: date) -> str:
+    """Normaliza uma data para o formato armazenado em `data` ('YYYY-MM-DD')."""
     if isinstance(d, str):
-        # Expecting already in ISO
-        return d
+        # Aceita ISO com ou sem horário ('2025-01-31', '2025-01-31T10:00:00')
+        return datetime.fromisoformat(d.strip()).date().isoformat()
     if isinstance(d, datetime):
         d = d.date()
     return d.isoformat()
 
 
-def add_transaction(
-    conn: sqlite3.Connection,
+def _add_date_range(sql: list, params: list, inicio: Optional[date], fim: Optional[date]) -> None:
+    # Predicados sobre a coluna crua (sargable): como `data` segue o contrato
+    # 'YYYY-MM-DD', a comparação de texto equivale à comparação de datas.
+    if inicio:
+        sql.append("AND data >= ?")
+        params.append(_to_iso(inicio))
+    if fim:
+        sql.append("AND data <= ?")
+        params.append(_to_iso(fim))
+
+
+def _ym_to_label(ym: str) -> str:
+    # Converter ym para rótulo Mês/Ano em pt-BR
+    d = datetime.strptime(ym + "-01", "%Y-%m-%d")
+    meses = [
+        "Jan", "Fev", "Mar", "Abr", "Mai", "Jun",
+        "Jul", "Ago", "Set", "Out", "Nov", "Dez",
+    ]
+    return f"{meses[d.month-1]}/{d.year}"
+
+
+def to_cents(valor) -> int:
+    """Converte um valor em reais (float, str, Decimal) para centavos inteiros."""
+    return int(Decimal(str(valor)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) * 100)
+
+
+def _series_to_cents(col: pd.Series) -> pd.Series:
+    """to_cents vetorizado (int64), com o mesmo arredondamento (meio centavo para cima).
+
+    Fora dos empates (x,xx5) o float basta; os empates dependem da
+    representação decimal do valor e passam por to_cents.
+    """
+    x = col.astype(float) * 100
+    centavos = x.round()
+    empate = (x % 1 - 0.5).abs() < 1e-3
+    if empate.any():
+        centavos[empate] = col[empate].map(to_cents)
+    return centavos.astype("int64")
+
+
+def _cents_to_money(df: pd.DataFrame, cols: list) -> pd.DataFrame:
+    # Borda: centavos inteiros (somados sem erro) -> reais para exibição
+    for col in cols:
+        df[col] = df[col].astype("int64") / 100
+    return df
+
+
+def get_data_version(conn: sqlite3.Connection, user_id: Optional[str]) -> int:
+    """Versão atual dos dados do usuário (0 se nunca houve escrita)."""
+    row = conn.execute(
+        "SELECT versao FROM versoes_dados WHERE user_id = ?", (user_id or "",)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(conn: sqlite3.Connection, user_id: Optional[str]) -> None:
+    # Não faz commit: deve rodar na mesma transação da escrita que invalida o cache
+    conn.execute(
+        """
+        INSERT INTO versoes_dados (user_id, versao) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET versao = versao + 1
+        """,
+        (user_id or "",),
+    )
+
+
+# Tags: palavras separadas por espaço, vírgula ou ';', com ou sem '#'
+_TAG_RE = r"[^\s,;#]+"
+
+
+def parse_tags(texto: Optional[str]) -> list[str]:
+    """Tags normalizadas de um texto livre: '#Trabalho, #mercado' -> ['trabalho', 'mercado']."""
+    return list(dict.fromkeys(re.findall(_TAG_RE, (texto or "").casefold())))
+
+
+def _tag_pairs(keys: pd.Series, tags: pd.Series) -> pd.DataFrame:
+    # (chave, tag) por tag de cada linha, sem repetição; `keys` alinhado a `tags`
+    tokens = tags.fillna("").astype(str).str.casefold().str.findall(_TAG_RE).explode().dropna()
+    return pd.DataFrame({"key": keys.loc[tokens.index].to_numpy(), "tag": tokens.to_numpy()}).drop_duplicates()
+
+
+def _write_tags(cur: sqlite3.Cursor, transacao_id: int, texto: Optional[str]) -> None:
+    cur.executemany(
+        "INSERT OR IGNORE INTO transacao_tags (transacao_id, tag) VALUES (?, ?)",
+        ((transacao_id, tag) for tag in parse_tags(texto)),
+    )
+
+
+def _backfill_tags(cur: sqlite3.Cursor, batch_size: int = 10_000) -> None:
+    rows = cur.execute("SELECT id, tags FROM transacoes WHERE tags IS NOT NULL AND tags <> ''")
+    while batch := rows.fetchmany(batch_size):
+        df = pd.DataFrame(batch, columns=["id", "tags"])
+        pares = _tag_pairs(df["id"], df["tags"])
+        cur.connection.executemany(
+            "INSERT OR IGNORE INTO transacao_tags (transacao_id, tag) VALUES (?, ?)",
+            pares.astype(object).itertuples(index=False, name=None),
+        )
+
+
+def _category_id(cur: sqlite3.Cursor, tipo: str, categoria: str, subcategoria: str) -> int:
+    # Busca (ou cria, se fora da taxonomia) a linha da dimensão
+    key = (tipo, categoria, subcategoria)
+    cur.execute("INSERT OR IGNORE INTO categorias (tipo, categoria, subcategoria) VALUES (?, ?, ?)", key)
+    return cur.execute(
+        "SELECT categoria_id FROM categorias WHERE tipo = ? AND categoria = ? AND subcategoria = ?", key
+    ).fetchone()[0]
+
+
+def _insert_transaction(
+    cur: sqlite3.Cursor,
     data_lanc: date,
     tipo: str,
     categoria: str,
@@ -85,21 +965,21 @@ def add_transaction(
     tags: str,
     user_id: Optional[str] = None,
 ) -> int:
-    cur = conn.cursor()
+    # INSERT do lançamento e das tags, sem commit nem versão de dados
+    centavos = to_cents(valor)
+    categoria_id = _category_id(cur, tipo, categoria, subcategoria)
     if user_id is None:
         # Compatibilidade com versões antigas: sem user_id
         cur.execute(
             """
-            INSERT INTO transacoes (data, tipo, categoria, subcategoria, descricao, valor, conta, tags)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO transacoes (data, categoria_id, descricao, valor_centavos, conta, tags)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
             (
                 _to_iso(data_lanc),
-                tipo,
-                categoria,
-                subcategoria,
+                categoria_id,
                 descricao,
-                float(valor),
+                centavos,
                 conta,
                 tags,
             ),
@@ -107,137 +987,1012 @@ def add_transaction(
     else:
         cur.execute(
             """
-            INSERT INTO transacoes (data, tipo, categoria, subcategoria, descricao, valor, conta, tags, user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO transacoes (data, categoria_id, descricao, valor_centavos, conta, tags, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 _to_iso(data_lanc),
-                tipo,
-                categoria,
-                subcategoria,
+                categoria_id,
                 descricao,
-                float(valor),
+                centavos,
                 conta,
                 tags,
                 user_id,
             ),
         )
-    conn.commit()
-    return cur.lastrowid
+    transacao_id = cur.lastrowid
+    _write_tags(cur, transacao_id, tags)
+    return transacao_id
 
 
-def get_transactions(
+def add_transaction(
     conn: sqlite3.Connection,
+    data_lanc: date,
+    tipo: str,
+    categoria: str,
+    subcategoria: str,
+    descricao: str,
+    valor: float,
+    conta: str,
+    tags: str,
     user_id: Optional[str] = None,
-    tipo: Optional[str] = None,
-    categoria: Optional[str] = None,
-    subcategoria: Optional[str] = None,
-    data_inicio: Optional[date] = None,
-    data_fim: Optional[date] = None,
-    busca: Optional[str] = None,
-) -> pd.DataFrame:
-    sql = [
-        "SELECT id, data, tipo, categoria, subcategoria, descricao, valor, conta, tags FROM transacoes WHERE 1=1",
-    ]
-    params: list = []
-    if user_id:
+) -> int:
+    cur = conn.cursor()
+    transacao_id = _insert_transaction(
+        cur, data_lanc, tipo, categoria, subcategoria, descricao, valor, conta, tags, user_id
+    )
+    bump_data_version(conn, user_id)
+    conn.commit()
+    return transacao_id
+
+
+def add_transactions(conn: sqlite3.Connection, rows: list[dict]) -> list:
+    """Grava vários lançamentos (argumentos de add_transaction) em um único commit.
+
+    Cada lançamento roda em um SAVEPOINT: se um falhar, só ele é desfeito.
+    Retorna, na ordem de `rows`, o id gravado ou a exceção de cada um.
+    """
+    cur = conn.cursor()
+    results: list = []
+    with conn:
+        # IMMEDIATE: pega o lock de escrita já no início do lote
+        cur.execute("BEGIN IMMEDIATE")
+        for row in rows:
+            cur.execute("SAVEPOINT lancamento")
+            try:
+                results.append(_insert_transaction(cur, **row))
+            except Exception as exc:
+                cur.execute("ROLLBACK TO lancamento")
+                results.append(exc)
+            cur.execute("RELEASE lancamento")
+        for user_id in {row.get("user_id") for row, r in zip(rows, results) if not isinstance(r, Exception)}:
+            bump_data_version(conn, user_id)
+    return results
+
+
+_TRANSACTION_COLUMNS = (
+    "SELECT id, data, tipo, categoria, subcategoria, descricao, "
+    "valor_centavos AS valor, conta, tags FROM transacoes JOIN categorias USING (categoria_id)"
+)
+
+
+def _transactions_where(
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> tuple[list, list]:
+    sql = ["WHERE 1=1"]
+    params: list = []
+    if user_id:
         sql.append("AND user_id = ?")
         params.append(user_id)
+    _add_category_filter(sql, params, tipo, categoria, subcategoria)
+    _add_date_range(sql, params, data_inicio, data_fim)
+    _add_busca(sql, params, busca)
+    _add_tag_filter(sql, params, tag)
+    return sql, params
+
+
+def _transactions_query(
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> tuple[str, list]:
+    where, params = _transactions_where(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    sql = [_TRANSACTION_COLUMNS, *where, "ORDER BY data DESC, id DESC"]
+    return " ".join(sql), params
+
+
+IMPORT_COLUMNS = ["data", "tipo", "categoria", "subcategoria", "descricao", "valor", "conta", "tags"]
+IMPORT_CHUNK_SIZE = 5000
+
+
+@dataclass
+class ImportReport:
+    """Resultado de uma importação em lote."""
+    inserted: int = 0
+    # Linhas recusadas com as colunas originais + `motivo`; o índice é o do DataFrame de entrada
+    rejected: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Linhas gravadas cuja categoria/subcategoria foi ajustada para o nome da taxonomia
+    adjusted: int = 0
+    # Linhas válidas ignoradas por já existirem (mesma impressão digital)
+    duplicates: int = 0
+    # Total de recusadas (import_csv_stream guarda só as primeiras em `rejected`)
+    rejected_count: int = 0
+    # Linhas do arquivo já gravadas por uma importação anterior (retomada)
+    resumed_from: int = 0
+
+
+# Similaridade mínima (difflib) para aceitar um nome de categoria aproximado
+IMPORT_FUZZY_CUTOFF = 0.85
+
+_TIPOS = {"despesa": "Despesa", "despesas": "Despesa", "receita": "Receita", "receitas": "Receita"}
+
+
+def _parse_dates(col: pd.Series) -> pd.Series:
+    # ISO primeiro (caminho rápido); depois dd/mm/aaaa, o formato dos extratos
+    # brasileiros; o resto passa pelo parser flexível com dia primeiro
+    datas = pd.to_datetime(col, errors="coerce", format="ISO8601")
+    resto = datas.isna() & col.notna()
+    if resto.any():
+        texto = col[resto].astype(str).str.strip()
+        datas[resto] = pd.to_datetime(texto, errors="coerce", format="%d/%m/%Y")
+        resto = datas.isna() & col.notna()
+        if resto.any():
+            datas[resto] = pd.to_datetime(
+                col[resto].astype(str).str.strip(), errors="coerce", format="mixed", dayfirst=True
+            )
+    return datas
+
+
+def _parse_amounts(col: pd.Series) -> pd.Series:
+    """Converte valores numéricos ou texto ('1.234,56', 'R$ 10,00', '12.5') em float."""
+    if pd.api.types.is_numeric_dtype(col):
+        return pd.to_numeric(col, errors="coerce")
+    texto = col.astype("string").str.strip().str.replace(r"^R\$\s*|\s", "", regex=True)
+    # Com vírgula: formato brasileiro (ponto = milhar). Sem vírgula, pontos em
+    # grupos de 3 dígitos também são milhar ('1.234'); senão, ponto decimal.
+    br = texto.str.contains(",", regex=False, na=False) | texto.str.fullmatch(r"-?\d{1,3}(\.\d{3})+", na=False)
+    texto = texto.where(~br, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(texto, errors="coerce")
+
+
+def _closest(key: str, candidates: dict) -> Optional[str]:
+    # `candidates`: chave normalizada -> nome canônico
+    if key in candidates:
+        return candidates[key]
+    match = difflib.get_close_matches(key, list(candidates), n=1, cutoff=IMPORT_FUZZY_CUTOFF)
+    return candidates[match[0]] if match else None
+
+
+def _match_taxonomy(tipo: str, categoria: str, subcategoria: str) -> tuple[Optional[str], Optional[str], str]:
+    """(categoria, subcategoria) canônicas de uma combinação, ou motivo da recusa."""
+    cat_key, sub_key = normalize_key(categoria), normalize_key(subcategoria)
+    for t, cat, sub in PAIR_INDEX.get((cat_key, sub_key), ()):
+        if t == tipo:
+            return cat, sub, ""
+    taxonomia = TAXONOMY_BY_TIPO[tipo]
+    if cat_key:
+        cat = _closest(cat_key, {normalize_key(c): c for c in taxonomia})
+        if cat is None:
+            return None, None, "categoria desconhecida"
+    else:
+        # Sem categoria: deduz pela subcategoria quando ela é única no tipo
+        donos = [c for t, c in find_subcategory(subcategoria) if t == tipo]
+        if len(donos) != 1:
+            return None, None, "categoria vazia"
+        cat = donos[0]
+    sub = _closest(sub_key, {normalize_key(s): s for s in taxonomia[cat]})
+    if sub is None:
+        return cat, None, "subcategoria desconhecida"
+    return cat, sub, ""
+
+
+def _coerce_import_frame(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, int]:
+    """Valida e converte as colunas de importação de forma vetorizada.
+
+    Datas (ISO, dd/mm/aaaa ou formatos livres), valores (inclusive '1.234,56'),
+    tipo (Receita/Despesa) e categoria/subcategoria, que são casadas com a
+    taxonomia de categories.py ignorando acentos e maiúsculas e, se preciso,
+    por nome aproximado. O casamento é feito uma vez por combinação distinta.
+
+    Retorna (linhas válidas já normalizadas, linhas recusadas com `motivo`,
+    nº de linhas com categoria/subcategoria ajustada).
+    """
+    missing = [c for c in ("data", "tipo", "categoria", "subcategoria", "valor") if c not in df.columns]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+
+    out = pd.DataFrame(index=df.index)
+    out["data"] = _parse_dates(df["data"]).dt.strftime("%Y-%m-%d")
+    for col in ("tipo", "categoria", "subcategoria"):
+        out[col] = df[col].astype("string").str.strip().fillna("")
+    out["tipo"] = out["tipo"].map({t: _TIPOS.get(normalize_key(t), "") for t in out["tipo"].unique()})
+    out["valor"] = _parse_amounts(df["valor"])
+    for col in ("descricao", "conta", "tags"):
+        out[col] = df[col].astype("string").fillna("") if col in df.columns else ""
+
+    motivo = pd.Series("", index=df.index, dtype="object")
+    motivo = motivo.mask(out["data"].isna() & (motivo == ""), "data inválida")
+    motivo = motivo.mask(out["valor"].isna() & (motivo == ""), "valor inválido")
+    motivo = motivo.mask((out["valor"] <= 0) & (motivo == ""), "valor deve ser maior que zero")
+    motivo = motivo.mask((out["tipo"] == "") & (motivo == ""), "tipo inválido (use Receita ou Despesa)")
+    motivo = motivo.mask((out["subcategoria"] == "") & (motivo == ""), "subcategoria vazia")
+
+    # Taxonomia: uma chamada por combinação distinta, resultado aplicado por merge
+    keys = ["tipo", "categoria", "subcategoria"]
+    pendentes = out.loc[motivo == "", keys]
+    combos = pendentes.drop_duplicates()
+    matched = [_match_taxonomy(*row) for row in combos.itertuples(index=False, name=None)]
+    combos = combos.assign(
+        cat_ok=[m[0] for m in matched], sub_ok=[m[1] for m in matched], motivo_tax=[m[2] for m in matched]
+    )
+    tax = pendentes.merge(combos, on=keys, how="left")  # merge à esquerda mantém a ordem
+    tax.index = pendentes.index
+    motivo.loc[tax.index] = tax["motivo_tax"]
+    ok = tax["motivo_tax"] == ""
+    ajustadas = ok & ((tax["cat_ok"] != tax["categoria"]) | (tax["sub_ok"] != tax["subcategoria"]))
+    out.loc[tax.index[ok], "categoria"] = tax.loc[ok, "cat_ok"]
+    out.loc[tax.index[ok], "subcategoria"] = tax.loc[ok, "sub_ok"]
+
+    bad = motivo != ""
+    rejected = df.loc[bad].copy()
+    rejected["motivo"] = motivo[bad]
+    return out.loc[~bad, IMPORT_COLUMNS], rejected, int(ajustadas.sum())
+
+
+def _content_hashes(user_id: Optional[str], rows: pd.DataFrame) -> pd.Series:
+    # Hash (int64) de usuário, data, centavos, descrição e conta, sem ordinal
+    def texto(col: pd.Series) -> pd.Series:
+        return col.fillna("").astype(str).str.strip().str.replace(r"\s+", " ", regex=True).str.casefold()
+
+    chave = pd.DataFrame({
+        "user_id": user_id or "",
+        "data": rows["data"].astype(str),
+        "centavos": rows["valor_centavos"].astype("int64"),
+        "descricao": texto(rows["descricao"]),
+        "conta": texto(rows["conta"]),
+    }, index=rows.index).astype({"user_id": object, "data": object, "descricao": object, "conta": object})
+    return pd.Series(pd.util.hash_pandas_object(chave, index=False).to_numpy().view("int64"), index=rows.index)
+
+
+def _fingerprints(
+    user_id: Optional[str],
+    rows: pd.DataFrame,
+    previous: Optional[pd.Series] = None,
+) -> pd.Series:
+    """Impressão digital (int64) de cada linha: usuário, data, centavos, descrição e conta.
+
+    Linhas idênticas no mesmo arquivo recebem um ordinal (0, 1, …) na ordem em
+    que aparecem, então dois cafés iguais no mesmo dia continuam sendo dois
+    lançamentos, e reimportar o mesmo extrato (ou um período sobreposto) gera
+    as mesmas impressões. `rows` tem data (ISO), valor_centavos, descricao e
+    conta. `previous` (hash do conteúdo -> ocorrências em blocos anteriores do
+    mesmo arquivo) continua a contagem entre blocos.
+    """
+    conteudo = _content_hashes(user_id, rows)
+    ordinal = conteudo.groupby(conteudo, sort=False).cumcount()
+    if previous is not None and len(previous):
+        ordinal = ordinal + conteudo.map(previous).fillna(0).astype("int64")
+    chave = pd.DataFrame({"conteudo": conteudo, "ordinal": ordinal.astype("int64")})
+    return pd.Series(pd.util.hash_pandas_object(chave, index=False).to_numpy().view("int64"), index=rows.index)
+
+
+def _existing_fingerprints(conn: sqlite3.Connection, impressoes: pd.Series) -> set:
+    # Consulta em conjunto (json_each) contra o índice único: uma instrução por bloco
+    existentes: set = set()
+    valores = impressoes.tolist()
+    for start in range(0, len(valores), IMPORT_CHUNK_SIZE):
+        bloco = json.dumps(valores[start:start + IMPORT_CHUNK_SIZE])
+        existentes.update(
+            r[0] for r in conn.execute(
+                "SELECT impressao FROM transacoes WHERE impressao IN (SELECT value FROM json_each(?))",
+                (bloco,),
+            )
+        )
+    return existentes
+
+
+def backfill_fingerprints(conn: sqlite3.Connection) -> int:
+    """Calcula a impressão digital das linhas antigas (sem `impressao`), por usuário.
+
+    Depois disso, reimportar um extrato já importado antes da v5 também é
+    reconhecido. Lançamentos manuais passam a contar como já existentes em
+    importações futuras com o mesmo conteúdo. Retorna o nº de linhas atualizadas.
+    """
+    total = 0
+    usuarios = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM transacoes WHERE impressao IS NULL")]
+    for uid in usuarios:
+        df = pd.read_sql_query(
+            """
+            SELECT id, data, valor_centavos, descricao, conta
+            FROM transacoes WHERE user_id IS ? AND impressao IS NULL ORDER BY id
+            """,
+            conn,
+            params=(uid,),
+        )
+        # Ordinais na ordem de gravação, como numa reimportação do mesmo extrato
+        df["impressao"] = _fingerprints(uid, df)
+        with conn:
+            cur = conn.executemany(
+                "UPDATE OR IGNORE transacoes SET impressao = ? WHERE id = ?",
+                df[["impressao", "id"]].astype(object).itertuples(index=False, name=None),
+            )
+        total += max(cur.rowcount, 0)
+    return total
+
+
+def _insert_valid(
+    conn: sqlite3.Connection,
+    valid: pd.DataFrame,
+    user_id: Optional[str],
+    impressoes: pd.Series,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> tuple[int, int]:
+    """Grava linhas já validadas, pulando as impressões existentes. Sem commit.
+
+    Retorna (inseridas, duplicadas). As tags de cada linha vão para
+    transacao_tags na mesma transação.
+    """
+    centavos = _series_to_cents(valid["valor"])
+    novas = ~impressoes.isin(_existing_fingerprints(conn, impressoes))
+    duplicates = int((~novas).sum())
+    valid, centavos, impressoes = valid[novas], centavos[novas], impressoes[novas]
+    rows = pd.DataFrame({
+        "data": valid["data"],
+        "categoria_id": _category_ids(conn, valid) if len(valid) else pd.Series(dtype="int64"),
+        "descricao": valid["descricao"],
+        "valor_centavos": centavos,
+        "conta": valid["conta"],
+        "tags": valid["tags"],
+        "user_id": user_id,
+        "impressao": impressoes,
+    })
+    sql = """
+        INSERT INTO transacoes (data, categoria_id, descricao, valor_centavos, conta, tags, user_id, impressao)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (impressao) WHERE impressao IS NOT NULL DO NOTHING
+    """
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows.iloc[start:start + chunk_size].astype(object)
+        cur = conn.executemany(sql, chunk.itertuples(index=False, name=None))
+        # Conflitos aqui são gravações concorrentes da mesma linha (DO NOTHING)
+        inserted += cur.rowcount
+        duplicates += len(chunk) - cur.rowcount
+    # Tags das linhas novas, localizadas pela impressão (índice único)
+    pares = _tag_pairs(impressoes, valid["tags"])
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO transacao_tags (transacao_id, tag)
+        SELECT id, ? FROM transacoes WHERE impressao = ?
+        """,
+        ((tag, int(key)) for key, tag in pares.itertuples(index=False, name=None)),
+    )
+    return inserted, duplicates
+
+
+def bulk_insert_transactions(
+    conn: sqlite3.Connection,
+    df: pd.DataFrame,
+    user_id: Optional[str],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> ImportReport:
+    """Importa um DataFrame de lançamentos em uma única transação.
+
+    As colunas são validadas/convertidas de uma vez (sem laço por linha) e as
+    linhas válidas são gravadas com `executemany` em blocos de `chunk_size`.
+    Se qualquer bloco falhar, nada é gravado.
+
+    Importar de novo o mesmo extrato não duplica lançamentos: cada linha tem
+    uma impressão digital (_fingerprints) com índice único, e as que já
+    existem são descartadas antes da gravação (contadas em `duplicates`).
+    """
+    valid, rejected, adjusted = _coerce_import_frame(df)
+    centavos = _series_to_cents(valid["valor"])
+    impressoes = _fingerprints(user_id, valid.assign(valor_centavos=centavos))
+    with conn:
+        inserted, duplicates = _insert_valid(conn, valid, user_id, impressoes, chunk_size)
+        if inserted:
+            bump_data_version(conn, user_id)
+    return ImportReport(
+        inserted=inserted,
+        rejected=rejected,
+        adjusted=adjusted,
+        duplicates=duplicates,
+        rejected_count=len(rejected),
+    )
 
-    if tipo:
-        sql.append("AND tipo = ?")
-        params.append(tipo)
-    if categoria:
-        sql.append("AND categoria = ?")
-        params.append(categoria)
-    if subcategoria:
-        sql.append("AND subcategoria = ?")
-        params.append(subcategoria)
-    if data_inicio:
-        sql.append("AND date(data) >= date(?)")
-        params.append(_to_iso(data_inicio))
-    if data_fim:
-        sql.append("AND date(data) <= date(?)")
-        params.append(_to_iso(data_fim))
-    if busca:
-        sql.append("AND (descricao LIKE ? OR conta LIKE ? OR tags LIKE ?)")
-        like = f"%{busca}%"
-        params.extend([like, like, like])
 
-    sql.append("ORDER BY date(data) DESC, id DESC")
+# Linhas recusadas guardadas no relatório de import_csv_stream (o total vai em rejected_count)
+IMPORT_REJECTED_LIMIT = 1000
 
-    df = pd.read_sql_query(" ".join(sql), conn, params=params)
+
+def file_sha256(source: BinaryIO, block_size: int = 1 << 20) -> str:
+    """sha256 de um arquivo binário lido em blocos; volta o cursor ao início."""
+    h = hashlib.sha256()
+    source.seek(0)
+    for block in iter(lambda: source.read(block_size), b""):
+        h.update(block)
+    source.seek(0)
+    return h.hexdigest()
+
+
+def _previous_occurrences(conn: sqlite3.Connection, importacao_id: int, conteudo: pd.Series) -> pd.Series:
+    chaves = json.dumps(conteudo.unique().tolist())
+    rows = conn.execute(
+        """
+        SELECT conteudo, qtd FROM importacoes_ocorrencias
+        WHERE importacao_id = ? AND conteudo IN (SELECT value FROM json_each(?))
+        """,
+        (importacao_id, chaves),
+    ).fetchall()
+    return pd.Series({r[0]: r[1] for r in rows}, dtype="int64")
+
+
+def import_csv_stream(
+    conn: sqlite3.Connection,
+    source,
+    user_id: Optional[str],
+    chunk_rows: int = IMPORT_CHUNK_SIZE,
+    nome: Optional[str] = None,
+    sep: Optional[str] = None,
+    encoding: str = "utf-8-sig",
+) -> ImportReport:
+    """Importa um CSV em blocos de `chunk_rows` linhas, com ponto de retomada.
+
+    Cada bloco é validado como em bulk_insert_transactions e gravado em uma
+    transação própria, junto com o checkpoint em `importacoes` (sha256 do
+    arquivo + nº de linhas já gravadas). Se a importação for interrompida,
+    chamar de novo com o mesmo arquivo continua da primeira linha não
+    gravada; um arquivo já concluído não é relido. A memória usada depende
+    de `chunk_rows`, não do tamanho do arquivo. `source` é caminho ou arquivo
+    binário; `sep=None` escolhe entre ',' e ';' pelo cabeçalho.
+    """
+    fechar = isinstance(source, (str, Path))
+    if fechar:
+        source = open(source, "rb")
+    try:
+        arquivo_hash = file_sha256(source)
+        if sep is None:
+            cabecalho = source.readline().decode(encoding, errors="replace")
+            source.seek(0)
+            sep = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+        agora = datetime.now().isoformat(timespec="seconds")
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO importacoes (user_id, arquivo_hash, nome, atualizado_em) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, arquivo_hash) DO NOTHING
+                """,
+                (user_id or "", arquivo_hash, nome, agora),
+            )
+        importacao_id, linhas, concluida = conn.execute(
+            "SELECT importacao_id, linhas, concluida FROM importacoes WHERE user_id = ? AND arquivo_hash = ?",
+            (user_id or "", arquivo_hash),
+        ).fetchone()
+        report = ImportReport(resumed_from=linhas)
+        if concluida:
+            return report
+
+        rejeitadas = []
+        # skiprows pula as linhas já gravadas sem convertê-las (o cabeçalho é a linha 0)
+        leitor = pd.read_csv(
+            source,
+            sep=sep,
+            encoding=encoding,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_rows,
+            skiprows=(lambda i: 0 < i <= linhas) if linhas else None,
+        )
+        for bloco in leitor:
+            bloco.index = bloco.index + linhas  # nº da linha de dados no arquivo
+            valid, rejected, adjusted = _coerce_import_frame(bloco)
+            centavos = _series_to_cents(valid["valor"])
+            conteudo = _content_hashes(user_id, valid.assign(valor_centavos=centavos))
+            with conn:
+                anteriores = _previous_occurrences(conn, importacao_id, conteudo)
+                impressoes = _fingerprints(user_id, valid.assign(valor_centavos=centavos), anteriores)
+                inserted, duplicates = _insert_valid(conn, valid, user_id, impressoes)
+                conn.executemany(
+                    """
+                    INSERT INTO importacoes_ocorrencias (importacao_id, conteudo, qtd) VALUES (?, ?, ?)
+                    ON CONFLICT (importacao_id, conteudo) DO UPDATE SET qtd = qtd + excluded.qtd
+                    """,
+                    ((importacao_id, int(k), int(n)) for k, n in conteudo.value_counts().items()),
+                )
+                linhas += len(bloco)
+                conn.execute(
+                    """
+                    UPDATE importacoes SET linhas = ?, inseridas = inseridas + ?, duplicadas = duplicadas + ?,
+                        recusadas = recusadas + ?, atualizado_em = ?
+                    WHERE importacao_id = ?
+                    """,
+                    (linhas, inserted, duplicates, len(rejected), datetime.now().isoformat(timespec="seconds"), importacao_id),
+                )
+                if inserted:
+                    bump_data_version(conn, user_id)
+            report.inserted += inserted
+            report.duplicates += duplicates
+            report.adjusted += adjusted
+            report.rejected_count += len(rejected)
+            guardadas = sum(len(r) for r in rejeitadas)
+            if guardadas < IMPORT_REJECTED_LIMIT and len(rejected):
+                rejeitadas.append(rejected.head(IMPORT_REJECTED_LIMIT - guardadas))
+        with conn:
+            # Concluída: as contagens de ocorrências só servem para retomar
+            conn.execute("UPDATE importacoes SET concluida = 1 WHERE importacao_id = ?", (importacao_id,))
+            conn.execute("DELETE FROM importacoes_ocorrencias WHERE importacao_id = ?", (importacao_id,))
+        if rejeitadas:
+            report.rejected = pd.concat(rejeitadas)
+        return report
+    finally:
+        if fechar:
+            source.close()
+
+
+def get_transactions(
+    conn: sqlite3.Connection,
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> pd.DataFrame:
+    sql, params = _transactions_query(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    df = pd.read_sql_query(sql, conn, params=params)
     if not df.empty:
         df["data"] = pd.to_datetime(df["data"]).dt.date
-    return df
+        _cents_to_money(df, ["valor"])
+    return _as_category(df)
 
 
-def get_monthly_cashflow(conn: sqlite3.Connection, inicio: date, fim: date, user_id: Optional[str] = None) -> pd.DataFrame:
-    sql = """
-        SELECT
-            strftime('%Y-%m', date(data)) AS ym,
-            SUM(CASE WHEN tipo = 'Receita' THEN valor ELSE -valor END) AS valor
-        FROM transacoes
-        WHERE 1=1 AND date(data) BETWEEN date(?) AND date(?)
+def _transactions_page_query(
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+    page_size: int = 50,
+    after: Optional[tuple] = None,
+    before: Optional[tuple] = None,
+) -> tuple[str, list]:
+    # O cursor vira a ponta do intervalo no índice (user_id, data): a busca
+    # começa direto na página pedida em vez de percorrer as anteriores.
+    if after:
+        data_fim = min(after[0], _to_iso(data_fim)) if data_fim else after[0]
+    elif before:
+        data_inicio = max(before[0], _to_iso(data_inicio)) if data_inicio else before[0]
+    where, params = _transactions_where(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    sql = [_TRANSACTION_COLUMNS, *where]
+    if after:
+        sql.append("AND (data, id) < (?, ?) ORDER BY data DESC, id DESC")
+        params.extend([after[0], after[1]])
+    elif before:
+        sql.append("AND (data, id) > (?, ?) ORDER BY data ASC, id ASC")
+        params.extend([before[0], before[1]])
+    else:
+        sql.append("ORDER BY data DESC, id DESC")
+    sql.append("LIMIT ?")
+    params.append(page_size)
+    return " ".join(sql), params
+
+
+def get_transactions_page(
+    conn: sqlite3.Connection,
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+    page_size: int = 50,
+    after: Optional[tuple] = None,
+    before: Optional[tuple] = None,
+) -> pd.DataFrame:
+    """Uma página de lançamentos, na ordem de get_transactions (data, id desc).
+
+    Paginação por cursor (keyset): `after` é o (data, id) da última linha da
+    página atual e traz a próxima; `before` é o da primeira linha e traz a
+    anterior. Sem cursor, devolve a primeira página. O custo não cresce com
+    a profundidade da página.
+    """
+    sql, params = _transactions_page_query(
+        user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag, page_size, after, before
+    )
+    df = pd.read_sql_query(sql, conn, params=params)
+    if before:
+        df = df.iloc[::-1].reset_index(drop=True)
+    if not df.empty:
+        df["data"] = pd.to_datetime(df["data"]).dt.date
+        _cents_to_money(df, ["valor"])
+    return _as_category(df)
+
+
+def page_cursor(row) -> tuple:
+    """Cursor (data ISO, id) de uma linha de get_transactions_page."""
+    return (_to_iso(row["data"]), int(row["id"]))
+
+
+def count_transactions(
+    conn: sqlite3.Connection,
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> int:
+    """Total de lançamentos com os mesmos filtros de get_transactions."""
+    sql, params = _count_transactions_query(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    return conn.execute(sql, params).fetchone()[0]
+
+
+def _count_transactions_query(
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> tuple[str, list]:
+    where, params = _transactions_where(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    return " ".join(["SELECT COUNT(*) FROM transacoes", *where]), params
+
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+def _format_cents(centavos: int) -> str:
+    # Decimal exato com ponto, como o to_csv gerava (ex.: 1234.5 -> '1234.50')
+    sinal = "-" if centavos < 0 else ""
+    reais, cents = divmod(abs(centavos), 100)
+    return f"{sinal}{reais}.{cents:02d}"
+
+
+def iter_transactions_csv(
+    conn: sqlite3.Connection,
+    user_id: Optional[str] = None,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    subcategoria: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    compress: bool = False,
+) -> Iterator[bytes]:
+    """Gera o CSV de exportação (UTF-8 com BOM) em blocos, direto do cursor.
+
+    Lê `chunk_size` linhas por vez com fetchmany, sem montar DataFrame nem a
+    lista completa em memória. Com `compress=True`, os blocos saem em gzip.
+    Mesmas colunas, filtros e ordem de get_transactions.
     """
-    params: list = [_to_iso(inicio), _to_iso(fim)]
+    sql, params = _transactions_query(user_id, tipo, categoria, subcategoria, data_inicio, data_fim, busca, tag)
+    cur = conn.execute(sql, params)
+    gz = zlib.compressobj(wbits=31) if compress else None  # wbits=31: cabeçalho gzip
+
+    def emit(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return gz.compress(data) if gz else data
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow([d[0] for d in cur.description])
+    first = emit("\ufeff" + buf.getvalue())
+    if first:
+        yield first
+    valor_idx = [d[0] for d in cur.description].index("valor")
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        buf.seek(0)
+        buf.truncate()
+        for row in rows:
+            row = list(row)
+            row[valor_idx] = _format_cents(row[valor_idx])
+            writer.writerow(row)
+        out = emit(buf.getvalue())
+        if out:
+            yield out
+    if gz:
+        yield gz.flush()
+
+
+def export_transactions_csv(conn: sqlite3.Connection, dest: BinaryIO, **kwargs) -> int:
+    """Grava o CSV de iter_transactions_csv em `dest`; retorna os bytes escritos."""
+    written = 0
+    for block in iter_transactions_csv(conn, **kwargs):
+        dest.write(block)
+        written += len(block)
+    return written
+
+
+COLUMNAR_FORMATS = ("parquet", "arrow")  # arrow = Arrow IPC stream (.arrows)
+
+
+def _arrow_schema():
+    import pyarrow as pa  # dependência do streamlit; importada só quando usada
+
+    categoria = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("data", pa.date32()),
+        ("tipo", categoria),
+        ("categoria", categoria),
+        ("subcategoria", categoria),
+        ("descricao", pa.string()),
+        ("valor", pa.decimal128(18, 2)),
+        ("conta", pa.string()),
+        ("tags", pa.string()),
+    ])
+
+
+def _cents_to_decimal_array(centavos: list):
+    import numpy as np
+    import pyarrow as pa
+
+    # decimal128(18, 2) guarda o inteiro sem escala (centavos) em 16 bytes
+    # little-endian; monta o buffer direto, sem Decimal por linha.
+    low = np.asarray(centavos, dtype=np.int64)
+    high = np.where(low < 0, -1, 0).astype(np.int64)
+    buf = np.column_stack([low, high]).ravel().tobytes()
+    return pa.Array.from_buffers(pa.decimal128(18, 2), len(low), [None, pa.py_buffer(buf)])
+
+
+def _rows_to_record_batch(rows: list, schema):
+    import pyarrow as pa
+
+    cols = list(zip(*rows))
+    arrays = [
+        pa.array(cols[0], pa.int64()),
+        pa.array(cols[1], pa.string()).cast(pa.date32()),
+        pa.array(cols[2], pa.string()).dictionary_encode(),
+        pa.array(cols[3], pa.string()).dictionary_encode(),
+        pa.array(cols[4], pa.string()).dictionary_encode(),
+        pa.array(cols[5], pa.string()),
+        _cents_to_decimal_array(cols[6]),
+        pa.array(cols[7], pa.string()),
+        pa.array(cols[8], pa.string()),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_transactions_columnar(
+    conn: sqlite3.Connection,
+    dest,
+    fmt: str = "parquet",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    **filters,
+) -> int:
+    """Exporta lançamentos em Parquet ou Arrow IPC (stream), com tipos reais.
+
+    Mesmas colunas/filtros/ordem de get_transactions; `data` é date32,
+    `valor` é decimal128(18, 2) exato e tipo/categoria/subcategoria são
+    colunas dictionary. Lê o cursor em blocos de `chunk_size` (um row group /
+    record batch por bloco). `dest` é caminho ou arquivo binário. Retorna o
+    nº de linhas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Formato desconhecido: {fmt}")
+    schema = _arrow_schema()
+    sql, params = _transactions_query(**filters)
+    cur = conn.execute(sql, params)
+    writer = pq.ParquetWriter(dest, schema) if fmt == "parquet" else pa.ipc.new_stream(dest, schema)
+    total = 0
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            batch = _rows_to_record_batch(rows, schema)
+            if fmt == "parquet":
+                writer.write_batch(batch, row_group_size=chunk_size)
+            else:
+                writer.write_batch(batch)
+            total += len(rows)
+    finally:
+        writer.close()
+    return total
+
+
+def read_transactions_columnar(source) -> pd.DataFrame:
+    """Lê um arquivo Parquet ou Arrow IPC (stream/arquivo) no formato de importação.
+
+    O formato é detectado pelos bytes iniciais. Devolve um DataFrame pronto
+    para bulk_insert_transactions (datas e valores já tipados).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fechar = isinstance(source, (str, Path))
+    if fechar:
+        source = open(source, "rb")
+    try:
+        head = source.read(6)
+        source.seek(0)
+        if head[:4] == b"PAR1":
+            table = pq.read_table(source)
+        elif head == b"ARROW1":
+            table = pa.ipc.open_file(source).read_all()
+        else:
+            table = pa.ipc.open_stream(source).read_all()
+    finally:
+        if fechar:
+            source.close()
+
+    missing = [c for c in IMPORT_COLUMNS if c not in table.column_names]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(missing)}")
+    valor = table.column("valor")
+    if pa.types.is_decimal(valor.type):
+        # decimal(…, 2) -> float64 é exato para centavos; bulk_insert volta a centavos
+        table = table.set_column(table.column_names.index("valor"), "valor", valor.cast(pa.float64()))
+    return table.select(IMPORT_COLUMNS).to_pandas()
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _raw_rows_query(
+    user_id, inicio, fim, eq: dict, busca: Optional[str] = None, tag: Optional[str] = None
+) -> tuple[str, list]:
+    sql = [
+        "SELECT substr(data, 1, 7) AS ym, categoria_id, SUM(valor_centavos) AS total_centavos,",
+        "COUNT(*) AS qtd",
+        "FROM transacoes WHERE 1=1",
+    ]
+    params: list = []
+    if user_id:
+        sql.append("AND user_id = ?")
+        params.append(user_id)
+    _add_category_filter(sql, params, **eq)
+    _add_date_range(sql, params, inicio, fim)
+    _add_busca(sql, params, busca)
+    _add_tag_filter(sql, params, tag)
+    sql.append("GROUP BY 1, 2")
+    return " ".join(sql), params
+
+
+def _rollup_rows_query(user_id, ym_inicio: Optional[str], ym_fim: Optional[str], eq: dict) -> tuple[str, list]:
+    sql = ["SELECT ym, categoria_id, total_centavos, qtd FROM resumo_mensal WHERE 1=1"]
+    params: list = []
     if user_id:
-        sql += " AND user_id = ?"
+        sql.append("AND user_id = ?")
         params.append(user_id)
-    sql += """
-    GROUP BY ym
-        ORDER BY ym
+    if ym_inicio:
+        sql.append("AND ym >= ?")
+        params.append(ym_inicio)
+    if ym_fim:
+        sql.append("AND ym <= ?")
+        params.append(ym_fim)
+    _add_category_filter(sql, params, **eq)
+    return " ".join(sql), params
+
+
+def _period_rows_query(
+    user_id: Optional[str],
+    inicio: Optional[date],
+    fim: Optional[date],
+    eq: Optional[dict] = None,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> tuple[str, list]:
+    """Subconsulta (ym, tipo, categoria, subcategoria, total_centavos, qtd) do período.
+
+    Meses inteiros dentro de [inicio, fim] vêm de resumo_mensal; meses
+    parciais nas pontas — ou o período todo, quando há `busca` ou `tag` — são
+    agregados direto de transacoes. As partes agregam por categoria_id e a
+    dimensão só é juntada no fim, sobre as linhas já agregadas.
     """
+    sql, params = _period_ids_query(user_id, inicio, fim, eq or {}, busca, tag)
+    sql = (
+        "SELECT p.ym, c.tipo, c.categoria, c.subcategoria, p.total_centavos, p.qtd "
+        f"FROM ({sql}) p JOIN categorias c USING (categoria_id)"
+    )
+    return sql, params
+
+
+def _period_ids_query(
+    user_id: Optional[str],
+    inicio: Optional[date],
+    fim: Optional[date],
+    eq: dict,
+    busca: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> tuple[str, list]:
+    # (ym, categoria_id, total_centavos, qtd) do período; ver _period_rows_query
+    ini = date.fromisoformat(_to_iso(inicio)) if inicio else None
+    end = date.fromisoformat(_to_iso(fim)) if fim else None
+    if busca or tag:
+        return _raw_rows_query(user_id, ini, end, eq, busca, tag)
+    # Meses inteiros: [first_full, after_full)
+    first_full = None if ini is None else (ini if ini.day == 1 else _next_month(ini))
+    after_full = None if end is None else (_next_month(end) if (end + timedelta(days=1)).day == 1 else end.replace(day=1))
+    if first_full and after_full and first_full >= after_full:
+        return _raw_rows_query(user_id, ini, end, eq)
+
+    parts = [
+        _rollup_rows_query(
+            user_id,
+            first_full.strftime("%Y-%m") if first_full else None,
+            (after_full - timedelta(days=1)).strftime("%Y-%m") if after_full else None,
+            eq,
+        )
+    ]
+    if ini and ini != first_full:
+        parts.append(_raw_rows_query(user_id, ini, first_full - timedelta(days=1), eq))
+    if end and end >= after_full:
+        parts.append(_raw_rows_query(user_id, after_full, end, eq))
+    sql = " UNION ALL ".join(p[0] for p in parts)
+    params = [v for p in parts for v in p[1]]
+    return sql, params
+
+
+def _monthly_cashflow_query(inicio: date, fim: date, user_id: Optional[str] = None) -> tuple[str, list]:
+    rows, params = _period_rows_query(user_id, inicio, fim)
+    sql = [
+        "SELECT",
+        "    ym,",
+        "    SUM(CASE WHEN tipo = 'Receita' THEN total_centavos ELSE -total_centavos END) AS valor",
+        f"FROM ({rows})",
+        "GROUP BY ym",
+        "ORDER BY ym",
+    ]
+    return " \n".join(sql), params
+
+
+def get_monthly_cashflow(conn: sqlite3.Connection, inicio: date, fim: date, user_id: Optional[str] = None) -> pd.DataFrame:
+    sql, params = _monthly_cashflow_query(inicio, fim, user_id)
     df = pd.read_sql_query(sql, conn, params=params)
     if df.empty:
         return df
-    # Converter ym para rótulo Mês/Ano em pt-BR
-    def ym_to_label(ym: str) -> str:
-        d = datetime.strptime(ym + "-01", "%Y-%m-%d")
-        meses = [
-            "Jan", "Fev", "Mar", "Abr", "Mai", "Jun",
-            "Jul", "Ago", "Set", "Out", "Nov", "Dez",
-        ]
-        return f"{meses[d.month-1]}/{d.year}"
-
-    df["mes"] = df["ym"].apply(ym_to_label)
+    _cents_to_money(df, ["valor"])
+    df["mes"] = df["ym"].apply(_ym_to_label)
     return df[["mes", "valor"]]
 
 
-def get_monthly_breakdown(conn: sqlite3.Connection, inicio: date, fim: date, user_id: Optional[str] = None) -> pd.DataFrame:
-    """Retorna receitas, despesas e saldo por mês entre [inicio, fim]."""
+def _monthly_breakdown_query(inicio: date, fim: date, user_id: Optional[str] = None) -> tuple[str, list]:
+    rows, params = _period_rows_query(user_id, inicio, fim)
     sql = [
         "SELECT",
-        "    strftime('%Y-%m', date(data)) AS ym,",
-        "    SUM(CASE WHEN tipo = 'Receita' THEN valor ELSE 0 END) AS receitas,",
-        "    SUM(CASE WHEN tipo = 'Despesa' THEN valor ELSE 0 END) AS despesas",
-        "FROM transacoes WHERE 1=1",
-    ]
-    params: list = []
-    if user_id:
-        sql.append("AND user_id = ?")
-        params.append(user_id)
-    sql.extend([
-        "AND date(data) BETWEEN date(?) AND date(?)",
+        "    ym,",
+        "    SUM(CASE WHEN tipo = 'Receita' THEN total_centavos ELSE 0 END) AS receitas,",
+        "    SUM(CASE WHEN tipo = 'Despesa' THEN total_centavos ELSE 0 END) AS despesas",
+        f"FROM ({rows})",
         "GROUP BY ym",
         "ORDER BY ym",
-    ])
-    params.extend([_to_iso(inicio), _to_iso(fim)])
-    df = pd.read_sql_query(" \n".join(sql), conn, params=params)
+    ]
+    return " \n".join(sql), params
+
+
+def get_monthly_breakdown(conn: sqlite3.Connection, inicio: date, fim: date, user_id: Optional[str] = None) -> pd.DataFrame:
+    """Retorna receitas, despesas e saldo por mês entre [inicio, fim]."""
+    sql, params = _monthly_breakdown_query(inicio, fim, user_id)
+    df = pd.read_sql_query(sql, conn, params=params)
     if df.empty:
         return df
-    def ym_to_label(ym: str) -> str:
-        d = datetime.strptime(ym + "-01", "%Y-%m-%d")
-        meses = [
-            "Jan", "Fev", "Mar", "Abr", "Mai", "Jun",
-            "Jul", "Ago", "Set", "Out", "Nov", "Dez",
-        ]
-        return f"{meses[d.month-1]}/{d.year}"
-    df["mes"] = df["ym"].apply(ym_to_label)
     df["saldo"] = df["receitas"] - df["despesas"]
+    _cents_to_money(df, ["receitas", "despesas", "saldo"])
+    df["mes"] = df["ym"].apply(_ym_to_label)
     return df[["mes", "ym", "receitas", "despesas", "saldo"]]
 
 
+def _sum_by_category_and_type_query(user_id: Optional[str], inicio: date, fim: date, tipo: str) -> tuple[str, list]:
+    rows, params = _period_rows_query(user_id, inicio, fim, {"tipo": tipo})
+    sql = f"SELECT categoria, SUM(total_centavos) AS valor FROM ({rows}) GROUP BY categoria ORDER BY valor DESC"
+    return sql, params
+
+
 def get_sum_by_category_and_type(
     conn: sqlite3.Connection,
     user_id: Optional[str],
@@ -246,54 +2001,451 @@ def get_sum_by_category_and_type(
     tipo: str,
 ) -> pd.DataFrame:
     """Somatório por categoria para um tipo ('Receita' ou 'Despesa') no período."""
-    sql = """
-        SELECT categoria, SUM(valor) AS valor
-        FROM transacoes
-        WHERE 1=1 AND tipo = ? AND date(data) BETWEEN date(?) AND date(?)
+    sql, params = _sum_by_category_and_type_query(user_id, inicio, fim, tipo)
+    df = pd.read_sql_query(sql, conn, params=params)
+    return _cents_to_money(_as_category(df), ["valor"])
+
+
+def _sum_by_category_query(filters: dict, tipo: str = "Despesa") -> tuple[str, list]:
+    # Somatório de um tipo (padrão: despesas) por categoria com filtros básicos aplicados
+    cat = filters.get("categoria")
+    subcat = filters.get("subcategoria")
+    eq = {
+        "tipo": tipo,
+        "categoria": cat if cat != "Todas" else None,
+        "subcategoria": subcat if subcat != "Todas" else None,
+    }
+    rows, params = _period_rows_query(
+        filters.get("user_id", ""),
+        filters.get("data_inicio"),
+        filters.get("data_fim"),
+        eq,
+        filters.get("busca"),
+        filters.get("tag"),
+    )
+    sql = f"SELECT categoria, SUM(total_centavos) AS valor FROM ({rows}) GROUP BY categoria ORDER BY valor DESC"
+    return sql, params
+
+
+def get_sum_by_category(conn: sqlite3.Connection, filters: dict, tipo: str = "Despesa") -> pd.DataFrame:
+    sql, params = _sum_by_category_query(filters, tipo)
+    df = pd.read_sql_query(sql, conn, params=params)
+    return _cents_to_money(_as_category(df), ["valor"])
+
+
+def _ym_shift(ym: str, months: int) -> str:
+    y, m = divmod(int(ym[:4]) * 12 + int(ym[5:7]) - 1 + months, 12)
+    return f"{y:04d}-{m + 1:02d}"
+
+
+# Meses de [?, ?] (YYYY-MM), um por linha: base das séries sem buracos para as janelas
+_MONTHS_CTE = """
+    meses(ym) AS (
+        SELECT ?
+        UNION ALL
+        SELECT strftime('%Y-%m', ym || '-01', '+1 month') FROM meses WHERE ym < ?
+    )
+"""
+
+
+def _monthly_trends_query(user_id: Optional[str], ym_inicio: str, ym_fim: str) -> tuple[str, list]:
+    # 11 meses antes do início alimentam a média de 12 meses do primeiro mês
+    historico = _ym_shift(ym_inicio, -11)
+    rows, params = _rollup_rows_query(user_id, historico, ym_fim, {})
+    abertura, abertura_params = _rollup_rows_query(user_id, None, _ym_shift(historico, -1), {})
+    todos, todos_params = _rollup_rows_query(user_id, None, ym_fim, {})
+    sql = f"""
+        WITH RECURSIVE {_MONTHS_CTE},
+        primeiro AS (SELECT MIN(ym) AS ym FROM ({todos})),
+        totais AS (
+            SELECT r.ym,
+                SUM(CASE WHEN c.tipo = 'Receita' THEN r.total_centavos ELSE 0 END) AS receitas,
+                SUM(CASE WHEN c.tipo = 'Despesa' THEN r.total_centavos ELSE 0 END) AS despesas
+            FROM ({rows}) r JOIN categorias c USING (categoria_id)
+            GROUP BY r.ym
+        ),
+        serie AS (
+            SELECT m.ym, COALESCE(t.receitas, 0) AS receitas, COALESCE(t.despesas, 0) AS despesas,
+                -- Meses antes do primeiro lançamento ficam fora das médias (NULL)
+                CASE WHEN m.ym >= p.ym THEN COALESCE(t.despesas, 0) END AS despesas_media,
+                CASE WHEN m.ym >= p.ym THEN COALESCE(t.receitas, 0) - COALESCE(t.despesas, 0) END AS saldo_media
+            FROM meses m CROSS JOIN primeiro p LEFT JOIN totais t USING (ym)
+        ),
+        janelas AS (
+            SELECT ym, receitas, despesas, receitas - despesas AS saldo,
+                AVG(despesas_media) OVER (ORDER BY ym ROWS 2 PRECEDING) AS despesas_mm3,
+                AVG(despesas_media) OVER (ORDER BY ym ROWS 5 PRECEDING) AS despesas_mm6,
+                AVG(despesas_media) OVER (ORDER BY ym ROWS 11 PRECEDING) AS despesas_mm12,
+                AVG(saldo_media) OVER (ORDER BY ym ROWS 2 PRECEDING) AS saldo_mm3,
+                AVG(saldo_media) OVER (ORDER BY ym ROWS 5 PRECEDING) AS saldo_mm6,
+                AVG(saldo_media) OVER (ORDER BY ym ROWS 11 PRECEDING) AS saldo_mm12,
+                SUM(receitas - despesas) OVER (ORDER BY ym ROWS UNBOUNDED PRECEDING) AS saldo_acumulado
+            FROM serie
+        )
+        SELECT ym, receitas, despesas, saldo, despesas_mm3, despesas_mm6, despesas_mm12,
+            saldo_mm3, saldo_mm6, saldo_mm12,
+            saldo_acumulado + (
+                SELECT COALESCE(SUM(CASE WHEN c.tipo = 'Receita' THEN a.total_centavos ELSE -a.total_centavos END), 0)
+                FROM ({abertura}) a JOIN categorias c USING (categoria_id)
+            ) AS saldo_acumulado
+        FROM janelas WHERE ym >= ? ORDER BY ym
+    """
+    return sql, [historico, ym_fim, *todos_params, *params, *abertura_params, ym_inicio]
+
+
+def get_monthly_trends(conn: sqlite3.Connection, user_id: Optional[str], inicio: date, fim: date) -> pd.DataFrame:
+    """Série mensal com médias móveis e saldo acumulado, calculada no SQLite.
+
+    Uma linha por mês de `inicio` a `fim` (meses inteiros do resumo mensal,
+    meses sem lançamentos valem zero): receitas, despesas, saldo, médias
+    móveis de 3, 6 e 12 meses das despesas e do saldo (os meses anteriores ao
+    início entram na janela) e saldo_acumulado desde o primeiro lançamento.
+    As médias só contam meses a partir do primeiro lançamento do usuário:
+    no começo do histórico a janela é menor, e antes dele a média é vazia.
+    """
+    sql, params = _monthly_trends_query(user_id, _to_iso(inicio)[:7], _to_iso(fim)[:7])
+    df = pd.read_sql_query(sql, conn, params=params)
+    cols = [c for c in df.columns if c != "ym"]
+    medias = [c for c in cols if "_mm" in c]
+    _cents_to_money(df, [c for c in cols if c not in medias])
+    df[medias] = df[medias].astype(float) / 100
+    df["mes"] = df["ym"].apply(_ym_to_label)
+    return df[["mes", "ym", *cols]]
+
+
+def _category_yoy_query(user_id: Optional[str], ym_inicio: str, ym_fim: str, tipo: str) -> tuple[str, list]:
+    historico = _ym_shift(ym_inicio, -12)
+    rows, params = _rollup_rows_query(user_id, historico, ym_fim, {"tipo": tipo})
+    sql = f"""
+        WITH RECURSIVE {_MONTHS_CTE},
+        totais AS (
+            SELECT r.ym, c.categoria, SUM(r.total_centavos) AS valor
+            FROM ({rows}) r JOIN categorias c USING (categoria_id)
+            GROUP BY r.ym, c.categoria
+        ),
+        grade AS (
+            SELECT m.ym, k.categoria, COALESCE(t.valor, 0) AS valor
+            FROM meses m
+            CROSS JOIN (SELECT DISTINCT categoria FROM totais) k
+            LEFT JOIN totais t ON t.ym = m.ym AND t.categoria = k.categoria
+        ),
+        comparado AS (
+            SELECT ym, categoria, valor,
+                LAG(valor, 12, 0) OVER (PARTITION BY categoria ORDER BY ym) AS valor_ano_anterior
+            FROM grade
+        )
+        SELECT categoria, SUM(valor) AS valor, SUM(valor_ano_anterior) AS valor_ano_anterior,
+            CASE WHEN SUM(valor_ano_anterior) > 0
+                THEN (SUM(valor) - SUM(valor_ano_anterior)) * 1.0 / SUM(valor_ano_anterior) END AS variacao
+        FROM comparado
+        WHERE ym >= ?
         GROUP BY categoria
+        HAVING SUM(valor) <> 0 OR SUM(valor_ano_anterior) <> 0
         ORDER BY valor DESC
     """
-    params: list = [tipo, _to_iso(inicio), _to_iso(fim)]
-    if user_id:
-        sql = sql.replace("WHERE 1=1", "WHERE user_id = ?")
-        params = [user_id] + params
+    return sql, [historico, ym_fim, *params, ym_inicio]
+
+
+def get_category_yoy(
+    conn: sqlite3.Connection,
+    user_id: Optional[str],
+    inicio: date,
+    fim: date,
+    tipo: str = "Despesa",
+) -> pd.DataFrame:
+    """Total por categoria no período contra os mesmos meses do ano anterior.
+
+    Colunas: categoria, valor, valor_ano_anterior e variacao (fração; vazia
+    sem base no ano anterior). Meses inteiros do resumo mensal, comparados
+    mês a mês com LAG de 12 meses no SQLite.
+    """
+    sql, params = _category_yoy_query(user_id, _to_iso(inicio)[:7], _to_iso(fim)[:7], tipo)
     df = pd.read_sql_query(sql, conn, params=params)
-    return df
-def get_sum_by_category(conn: sqlite3.Connection, filters: dict) -> pd.DataFrame:
-    # Somatório de despesas por categoria com filtros básicos aplicados
+    return _cents_to_money(_as_category(df, ("categoria",)), ["valor", "valor_ano_anterior"])
+
+
+def _spend_by_tag_query(
+    user_id: Optional[str], inicio: Optional[date], fim: Optional[date], tipo: str = "Despesa"
+) -> tuple[str, list]:
     sql = [
-        "SELECT categoria, SUM(valor) AS valor FROM transacoes WHERE tipo='Despesa'",
+        "SELECT substr(data, 1, 7) AS ym, tag, SUM(valor_centavos) AS valor, COUNT(*) AS qtd",
+        "FROM transacoes JOIN transacao_tags ON transacao_id = id WHERE 1=1",
     ]
     params: list = []
-    uid = filters.get("user_id", "")
-    if uid:
+    if user_id:
         sql.append("AND user_id = ?")
-        params.append(uid)
+        params.append(user_id)
+    _add_date_range(sql, params, inicio, fim)
+    _add_category_filter(sql, params, tipo=tipo)
+    sql.append("GROUP BY 1, 2 ORDER BY 1, 3 DESC")
+    return " ".join(sql), params
 
-    cat = filters.get("categoria")
-    subcat = filters.get("subcategoria")
-    inicio = filters.get("data_inicio")
-    fim = filters.get("data_fim")
-    busca = filters.get("busca")
 
+def get_spend_by_tag(
+    conn: sqlite3.Connection,
+    user_id: Optional[str],
+    inicio: Optional[date],
+    fim: Optional[date],
+    tipo: str = "Despesa",
+) -> pd.DataFrame:
+    """Total (e nº de lançamentos) por tag e mês no período: mes, ym, tag, valor, qtd.
+
+    Lê transacao_tags pelo índice, sem separar o texto de `tags`. Um
+    lançamento com várias tags conta em cada uma delas.
+    """
+    sql, params = _spend_by_tag_query(user_id, inicio, fim, tipo)
+    df = pd.read_sql_query(sql, conn, params=params)
+    if df.empty:
+        return df
+    _cents_to_money(df, ["valor"])
+    df["mes"] = df["ym"].apply(_ym_to_label)
+    return df[["mes", "ym", "tag", "valor", "qtd"]]
+
+
+def get_month_version(conn: sqlite3.Connection, user_id: Optional[str], ym: str) -> int:
+    """Versão dos lançamentos do usuário no mês `ym` (YYYY-MM); 0 se nunca mudou."""
+    row = conn.execute(
+        "SELECT versao FROM versoes_mes WHERE user_id = ? AND ym = ?", (user_id or "", ym)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def get_month_category_totals(conn: sqlite3.Connection, user_id: Optional[str], ym: str) -> pd.DataFrame:
+    """Totais do mês inteiro por tipo e categoria (tipo, categoria, valor), do resumo mensal."""
+    sql, params = _month_category_totals_query(user_id, ym)
+    df = pd.read_sql_query(sql, conn, params=params)
+    return _cents_to_money(df, ["valor"])
+
+
+def _month_category_totals_query(user_id: Optional[str], ym: str) -> tuple[str, list]:
+    sql = """
+        SELECT c.tipo, c.categoria, SUM(resumo_mensal.total_centavos) AS valor
+        FROM resumo_mensal JOIN categorias c USING (categoria_id)
+        WHERE resumo_mensal.user_id = ? AND resumo_mensal.ym = ?
+        GROUP BY c.tipo, c.categoria
+    """
+    return sql, [user_id or "", ym]
+
+
+def get_targets(conn: sqlite3.Connection, user_id: Optional[str]) -> dict[str, float]:
+    """Metas gravadas do usuário: {categoria: fração da receita}; '' é a poupança."""
+    rows = conn.execute("SELECT categoria, alvo FROM metas WHERE user_id = ?", (user_id or "",)).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def set_targets(conn: sqlite3.Connection, user_id: Optional[str], targets: dict[str, float]) -> None:
+    """Substitui as metas do usuário e descarta os avisos calculados com as antigas."""
+    uid = user_id or ""
+    with conn:
+        conn.execute("DELETE FROM metas WHERE user_id = ?", (uid,))
+        conn.executemany(
+            "INSERT INTO metas (user_id, categoria, alvo) VALUES (?, ?, ?)",
+            ((uid, cat, float(alvo)) for cat, alvo in targets.items()),
+        )
+        conn.execute("DELETE FROM avisos_mes WHERE user_id = ?", (uid,))
+        bump_data_version(conn, user_id)
+
+
+def load_advice(conn: sqlite3.Connection, user_id: Optional[str], ym: str) -> Optional[tuple[int, str]]:
+    """Avisos em cache do mês: (versão do mês usada no cálculo, JSON) ou None."""
+    row = conn.execute(
+        "SELECT versao, avisos FROM avisos_mes WHERE user_id = ? AND ym = ?", (user_id or "", ym)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def store_advice(conn: sqlite3.Connection, user_id: Optional[str], ym: str, versao: int, avisos: str) -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO avisos_mes (user_id, ym, versao, avisos) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, ym) DO UPDATE SET versao = excluded.versao, avisos = excluded.avisos
+            """,
+            (user_id or "", ym, versao, avisos),
+        )
+
+
+@dataclass
+class DashboardSnapshot:
+    """Todos os agregados da aba "Visão geral" (valores em reais)."""
+    total_receitas: float = 0.0
+    total_despesas: float = 0.0
+    saldo: float = 0.0
+    # mes, valor (saldo do mês) — mesmo formato de get_monthly_cashflow
+    cashflow: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # mes, ym, receitas, despesas, saldo — mesmo formato de get_monthly_breakdown
+    breakdown: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # categoria, valor — despesas, mesmo formato de get_sum_by_category
+    por_categoria: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # categoria, subcategoria, valor — despesas com todos os filtros
+    por_subcategoria: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Último mês do período (YYYY-MM); os avisos desse mês vêm de advice.get_advice
+    ym_atual: Optional[str] = None
+
+
+def _dashboard_rows_query(filters: dict) -> tuple[str, list]:
+    uid = filters.get("user_id", "")
+    inicio, fim = filters.get("data_inicio"), filters.get("data_fim")
+    busca, tag = filters.get("busca"), filters.get("tag")
+    sql, params = _period_rows_query(uid, inicio, fim)
+    sql = f"SELECT ym, tipo, categoria, subcategoria, total_centavos, 0 AS filtrada FROM ({sql})"
+    if busca or parse_tags(tag):
+        busca_sql, busca_params = _period_rows_query(uid, inicio, fim, busca=busca, tag=tag)
+        sql += f" UNION ALL SELECT ym, tipo, categoria, subcategoria, total_centavos, 1 FROM ({busca_sql})"
+        params = params + busca_params
+    return sql, params
+
+
+def get_dashboard_snapshot(conn: sqlite3.Connection, filters: dict) -> DashboardSnapshot:
+    """Agregados da visão geral a partir de uma única consulta.
+
+    A consulta devolve linhas (ym, tipo, categoria, subcategoria, total) do
+    período do usuário — meses inteiros vindos de resumo_mensal. Com `busca`
+    ou `tag`, as linhas que casam vêm na mesma consulta (UNION ALL, marcadas
+    por `filtrada`). O resto é derivado em pandas sobre esse conjunto pequeno,
+    com as mesmas regras de filtro das funções individuais: fluxo/comparativo
+    mensal só por período; totais e subcategorias com todos os
+    filtros; por_categoria ignora o filtro de tipo (só despesas).
+    """
+    filtrada = bool(filters.get("busca")) or bool(parse_tags(filters.get("tag")))
+    sql, params = _dashboard_rows_query(filters)
+    rows = _as_category(pd.read_sql_query(sql, conn, params=params))
+
+    snap = DashboardSnapshot()
+    periodo = rows[rows["filtrada"] == 0]
+    if periodo.empty:
+        return snap
+
+    # Fluxo e comparativo mensal: só período + usuário
+    brkd = (
+        periodo.assign(
+            receitas=periodo["total_centavos"].where(periodo["tipo"] == "Receita", 0),
+            despesas=periodo["total_centavos"].where(periodo["tipo"] == "Despesa", 0),
+        )
+        .groupby("ym", as_index=False)[["receitas", "despesas"]].sum()
+        .sort_values("ym")
+    )
+    brkd["saldo"] = brkd["receitas"] - brkd["despesas"]
+    _cents_to_money(brkd, ["receitas", "despesas", "saldo"])
+    brkd["mes"] = brkd["ym"].apply(_ym_to_label)
+    snap.breakdown = brkd[["mes", "ym", "receitas", "despesas", "saldo"]].reset_index(drop=True)
+    snap.cashflow = snap.breakdown[["mes"]].assign(valor=snap.breakdown["saldo"])
+
+    # Filtros de categoria/subcategoria/busca/tag (o de tipo é aplicado depois)
+    base = rows[rows["filtrada"] == 1] if filtrada else periodo
+    cat, subcat = filters.get("categoria"), filters.get("subcategoria")
     if cat and cat != "Todas":
-        sql.append("AND categoria = ?")
-        params.append(cat)
+        base = base[base["categoria"] == cat]
     if subcat and subcat != "Todas":
-        sql.append("AND subcategoria = ?")
-        params.append(subcat)
-    if inicio:
-        sql.append("AND date(data) >= date(?)")
-        params.append(_to_iso(inicio))
-    if fim:
-        sql.append("AND date(data) <= date(?)")
-        params.append(_to_iso(fim))
-    if busca:
-        sql.append("AND (descricao LIKE ? OR conta LIKE ? OR tags LIKE ?)")
-        like = f"%{busca}%"
-        params.extend([like, like, like])
+        base = base[base["subcategoria"] == subcat]
+    despesas = base[base["tipo"] == "Despesa"]
+    snap.por_categoria = _cents_to_money(
+        despesas.groupby("categoria", as_index=False, observed=True)["total_centavos"].sum()
+        .rename(columns={"total_centavos": "valor"})
+        .sort_values("valor", ascending=False, ignore_index=True),
+        ["valor"],
+    )
 
-    sql.append("GROUP BY categoria ORDER BY valor DESC")
+    tipo = filters.get("tipo")
+    filtrado = base[base["tipo"] == tipo] if tipo and tipo != "Todos" else base
+    snap.total_receitas = int(filtrado.loc[filtrado["tipo"] == "Receita", "total_centavos"].sum()) / 100
+    snap.total_despesas = int(filtrado.loc[filtrado["tipo"] == "Despesa", "total_centavos"].sum()) / 100
+    snap.saldo = snap.total_receitas - snap.total_despesas
 
-    df = pd.read_sql_query(" ".join(sql), conn, params=params)
-    return df
+    desp_filtradas = filtrado[filtrado["tipo"] == "Despesa"]
+    snap.por_subcategoria = _cents_to_money(
+        desp_filtradas.groupby(["categoria", "subcategoria"], as_index=False, observed=True)["total_centavos"].sum()
+        .rename(columns={"total_centavos": "valor"})
+        .sort_values("valor", ascending=False, ignore_index=True),
+        ["valor"],
+    )
+
+    snap.ym_atual = snap.breakdown["ym"].iloc[-1]
+    return snap
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: list) -> list[str]:
+    """Retorna as linhas de detalhe do EXPLAIN QUERY PLAN de uma consulta."""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+# Únicos acessos aceitos às tabelas base: busca por intervalo nos índices
+_PLAN_ACCESS_OK = {
+    "transacoes": (
+        "SEARCH transacoes USING INDEX idx_transacoes_user_data (user_id=? AND data>? AND data<?)",
+        # count_transactions sem outros filtros: só o índice, sem ler a tabela
+        "SEARCH transacoes USING COVERING INDEX idx_transacoes_user_data (user_id=? AND data>? AND data<?)",
+    ),
+    "resumo_mensal": (
+        "SEARCH resumo_mensal USING PRIMARY KEY (user_id=? AND ym>? AND ym<?)",
+        # Saldo de abertura de get_monthly_trends: todo o histórico do usuário antes da janela
+        "SEARCH resumo_mensal USING PRIMARY KEY (user_id=? AND ym<?)",
+        # Mês único (get_month_category_totals)
+        "SEARCH resumo_mensal USING PRIMARY KEY (user_id=? AND ym=?)",
+    ),
+    "transacao_tags": (
+        "SEARCH transacao_tags USING PRIMARY KEY (transacao_id=?)",
+        # Filtro de tag: ids do lançamento pelo índice (tag, transacao_id)
+        "SEARCH transacao_tags USING COVERING INDEX idx_transacao_tags_tag (tag=?)",
+    ),
+}
+
+
+class QueryPlanError(RuntimeError):
+    """Consulta cujo plano acessa uma tabela base sem busca por intervalo em índice."""
+
+
+def check_query_plans(conn: sqlite3.Connection, user_id: str = "plan-check") -> dict[str, list[str]]:
+    """Regressão de planos: toda leitura deve ser busca por intervalo em índice.
+
+    Monta a SQL de cada função pública de consulta com filtros de usuário e
+    de um período com meses parciais nas pontas (exercita resumo_mensal e
+    transacoes) e falha (QueryPlanError) se alguma tabela base for acessada
+    de outra forma (ex.: SCAN). As tabelas base não levam apelido nessas
+    consultas, para aparecerem pelo nome no plano. Retorna os planos por função.
+    """
+    inicio, fim = date(2024, 1, 15), date(2024, 12, 10)
+    queries = {
+        "get_transactions": _transactions_query(user_id, data_inicio=inicio, data_fim=fim),
+        "get_transactions_page": _transactions_page_query(
+            user_id, data_inicio=inicio, data_fim=fim, after=("2024-06-30", 1000)
+        ),
+        "get_transactions_page (busca)": _transactions_page_query(
+            user_id, data_inicio=inicio, data_fim=fim, busca="mercado", after=("2024-06-30", 1000)
+        ),
+        "get_transactions_page (tag)": _transactions_page_query(
+            user_id, data_inicio=inicio, data_fim=fim, tag="#mercado #casa", before=("2024-03-01", 10)
+        ),
+        "count_transactions": _count_transactions_query(user_id, data_inicio=inicio, data_fim=fim),
+        "count_transactions (busca e tag)": _count_transactions_query(
+            user_id, data_inicio=inicio, data_fim=fim, busca="mercado", tag="#casa"
+        ),
+        "get_dashboard_snapshot": _dashboard_rows_query(
+            {"user_id": user_id, "data_inicio": inicio, "data_fim": fim}
+        ),
+        "get_dashboard_snapshot (busca e tag)": _dashboard_rows_query(
+            {"user_id": user_id, "data_inicio": inicio, "data_fim": fim, "busca": "mercado", "tag": "#casa"}
+        ),
+        "get_month_category_totals": _month_category_totals_query(user_id, "2024-06"),
+        "get_monthly_cashflow": _monthly_cashflow_query(inicio, fim, user_id),
+        "get_monthly_breakdown": _monthly_breakdown_query(inicio, fim, user_id),
+        "get_sum_by_category_and_type": _sum_by_category_and_type_query(user_id, inicio, fim, "Despesa"),
+        "get_sum_by_category": _sum_by_category_query(
+            {"user_id": user_id, "categoria": "Moradia", "data_inicio": inicio, "data_fim": fim}
+        ),
+        "get_spend_by_tag": _spend_by_tag_query(user_id, inicio, fim),
+        "get_monthly_trends": _monthly_trends_query(user_id, "2024-01", "2024-12"),
+        "get_category_yoy": _category_yoy_query(user_id, "2024-01", "2024-12", "Despesa"),
+    }
+    plans = {}
+    for name, (sql, params) in queries.items():
+        plan = explain_query_plan(conn, sql, params)
+        for step in plan:
+            for table, expected in _PLAN_ACCESS_OK.items():
+                # Sem assert: `python -O` não pode desligar a verificação
+                if f" {table} " in f" {step} " and step.startswith(("SCAN", "SEARCH")) and step not in expected:
+                    raise QueryPlanError(f"{name}: acesso sem busca por intervalo: {step!r}")
+        if not any(step.startswith("SEARCH") for step in plan):
+            raise QueryPlanError(f"{name}: plano sem busca: {plan}")
+        plans[name] = plan
+    return plans
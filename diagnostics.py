@@ -0,0 +1,342 @@
+"""Instrumentação opcional do acesso ao banco.
+
+Desligada por padrão. Com `FINANCE_DB_PROFILE=1` no ambiente (ou chamando
+`enable()` antes da primeira conexão), cada função pública do `db` passa a
+registrar latência, linhas devolvidas, usuário, formato dos filtros e as
+instruções SQL emitidas (texto com `?` e os tipos dos parâmetros — nunca os
+valores). Chamadas acima de `SLOW_QUERY_MS` vão para o log de consultas
+lentas com o EXPLAIN QUERY PLAN de cada SELECT.
+
+Os registros ficam por thread; como o Streamlit roda cada rerun em uma
+thread, `start_rerun()` + `rerun_calls()` dão as consultas de um rerun.
+
+Independente disso, `section(nome)` cronometra trechos nomeados do app
+(carga de dados, agregação, gráficos, tabelas, exportação) a cada rerun;
+`rerun_sections()` devolve o detalhamento e `finish_rerun()` o registra no
+log (`FINANCE_APP_PROFILE=1` para nível INFO).
+"""
+import collections
+import contextlib
+import functools
+import inspect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import pandas as pd
+
+import db
+
+SLOW_QUERY_MS = float(os.environ.get("FINANCE_SLOW_QUERY_MS", "100"))
+
+logger = logging.getLogger("controle_financeiro.db")
+slow_logger = logging.getLogger("controle_financeiro.db.slow")
+app_logger = logging.getLogger("controle_financeiro.app")
+
+ENABLED = False
+_ENABLE_LOCK = threading.Lock()
+_local = threading.local()
+
+# Últimas consultas lentas do processo (todas as sessões), para o painel
+SLOW_LOG: collections.deque = collections.deque(maxlen=50)
+
+
+@dataclass
+class Statement:
+    sql: str
+    param_shape: str
+    # Guardados só para o EXPLAIN do log lento; não são logados
+    params: Any = field(default=None, repr=False)
+    many: bool = False
+
+
+@dataclass
+class SectionRecord:
+    name: str
+    depth: int
+    elapsed_ms: float = 0.0
+    # Tempo e chamadas do db dentro da seção (só com a instrumentação ligada)
+    db_ms: float = 0.0
+    db_calls: int = 0
+
+
+@dataclass
+class CallRecord:
+    function: str
+    user_id: str
+    filters: str
+    depth: int
+    elapsed_ms: float = 0.0
+    rows: Optional[int] = None
+    statements: list = field(default_factory=list)
+    plans: dict = field(default_factory=dict)
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _calls() -> list:
+    if not hasattr(_local, "calls"):
+        _local.calls = []
+    return _local.calls
+
+
+def _sections() -> list:
+    if not hasattr(_local, "sections"):
+        _local.sections = []
+    return _local.sections
+
+
+def _db_totals() -> tuple[float, int]:
+    return getattr(_local, "db_ms", 0.0), getattr(_local, "db_calls", 0)
+
+
+def _param_shape(params: Any) -> str:
+    if params is None:
+        return ""
+    if isinstance(params, dict):
+        return "{" + ", ".join(sorted(params)) + "}"
+    return "(" + ", ".join(type(p).__name__ for p in params) + ")"
+
+
+def _record_statement(sql: str, params: Any, many: bool = False) -> None:
+    stack = _stack()
+    if stack:
+        stack[-1].statements.append(
+            Statement(" ".join(sql.split()), "[lote]" if many else _param_shape(params), params, many)
+        )
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        _record_statement(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        _record_statement(sql, None, many=True)
+        return super().executemany(sql, seq_of_parameters)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _active(value: Any) -> bool:
+    return value not in (None, "", "Todas", "Todos")
+
+
+def _describe_args(sig: inspect.Signature, args: tuple, kwargs: dict) -> tuple[str, str]:
+    # (usuário, nomes dos filtros preenchidos) — forma da consulta, sem valores
+    try:
+        bound = sig.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        return "", ""
+    filters = bound.get("filters") if isinstance(bound.get("filters"), dict) else {}
+    user_id = bound.get("user_id") or filters.get("user_id") or ""
+    shape = [
+        name for name, value in {**bound, **filters}.items()
+        if name not in ("conn", "filters", "user_id", "df") and _active(value)
+        and not isinstance(value, sqlite3.Connection)
+    ]
+    return str(user_id), ",".join(shape)
+
+
+def _result_rows(result: Any) -> Optional[int]:
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, db.DashboardSnapshot):
+        return len(result.breakdown) + len(result.por_subcategoria)
+    if isinstance(result, db.ImportReport):
+        return result.inserted
+    return None
+
+
+def _explain_slow(conn: Any, rec: CallRecord) -> None:
+    # Versão original (sem wrapper) para o EXPLAIN não entrar nos próprios registros
+    explain = getattr(db.explain_query_plan, "__wrapped__", db.explain_query_plan)
+    if isinstance(conn, sqlite3.Connection):
+        for st in rec.statements:
+            if st.many or not st.sql.upper().startswith(("SELECT", "WITH")):
+                continue
+            try:
+                rec.plans[st.sql] = explain(conn, st.sql, st.params or [])
+            except sqlite3.Error as e:
+                rec.plans[st.sql] = [f"(EXPLAIN falhou: {e})"]
+    SLOW_LOG.append(rec)
+    slow_logger.warning(
+        "consulta lenta: %s %.1f ms (usuário=%s filtros=%s linhas=%s)\n%s",
+        rec.function, rec.elapsed_ms, rec.user_id, rec.filters, rec.rows,
+        "\n".join(f"  {sql}\n    plano: {' | '.join(plan)}" for sql, plan in rec.plans.items()),
+    )
+
+
+def _wrap(name: str, fn):
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        user_id, filters = _describe_args(sig, args, kwargs)
+        stack = _stack()
+        rec = CallRecord(function=name, user_id=user_id, filters=filters, depth=len(stack))
+        stack.append(rec)
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            rec.elapsed_ms = (time.perf_counter() - t0) * 1000
+            stack.pop()
+            _calls().append(rec)
+            if rec.depth == 0:
+                _local.db_ms = getattr(_local, "db_ms", 0.0) + rec.elapsed_ms
+                _local.db_calls = getattr(_local, "db_calls", 0) + 1
+        rec.rows = _result_rows(result)
+        logger.debug(
+            "%s %.2f ms usuário=%s filtros=%s linhas=%s sql=%d",
+            name, rec.elapsed_ms, user_id, filters, rec.rows, len(rec.statements),
+        )
+        if rec.depth == 0 and rec.elapsed_ms >= SLOW_QUERY_MS:
+            _explain_slow(args[0] if args else kwargs.get("conn"), rec)
+        return result
+
+    return wrapper
+
+
+def enable() -> None:
+    """Liga a instrumentação no processo (idempotente).
+
+    Deve rodar antes de o pool abrir conexões: só conexões novas usam a
+    classe instrumentada.
+    """
+    global ENABLED
+    with _ENABLE_LOCK:
+        if ENABLED:
+            return
+        db.CONNECTION_FACTORY = InstrumentedConnection
+        for name, fn in list(vars(db).items()):
+            if name.startswith("_") or not inspect.isfunction(fn) or fn.__module__ != db.__name__:
+                continue
+            params = list(inspect.signature(fn).parameters)
+            if params and params[0] == "conn":
+                setattr(db, name, _wrap(name, fn))
+        ENABLED = True
+
+
+def setup_from_env() -> bool:
+    """Liga a instrumentação se FINANCE_DB_PROFILE=1. Retorna se está ligada."""
+    if os.environ.get("FINANCE_DB_PROFILE", "").strip() in ("1", "true", "True"):
+        enable()
+    return ENABLED
+
+
+def start_rerun() -> None:
+    """Zera os registros da thread atual (início de um rerun)."""
+    _local.calls = []
+    _local.stack = []
+    _local.sections = []
+    _local.section_path = []
+    _local.db_ms = 0.0
+    _local.db_calls = 0
+    _local.rerun_t0 = time.perf_counter()
+
+
+@contextlib.contextmanager
+def section(name: str):
+    """Cronometra um trecho do rerun; seções aninhadas viram `pai › filho`."""
+    path = getattr(_local, "section_path", None)
+    if path is None:
+        path = _local.section_path = []
+    rec = SectionRecord(name=" › ".join([*path, name]), depth=len(path))
+    _sections().append(rec)
+    path.append(name)
+    db_ms0, db_calls0 = _db_totals()
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec.elapsed_ms = (time.perf_counter() - t0) * 1000
+        db_ms1, db_calls1 = _db_totals()
+        rec.db_ms = db_ms1 - db_ms0
+        rec.db_calls = db_calls1 - db_calls0
+        path.pop()
+
+
+def rerun_sections() -> pd.DataFrame:
+    """Tempo de cada seção do rerun atual, na ordem de execução."""
+    rows = [
+        {
+            "seção": ("  " * r.depth) + r.name.rsplit(" › ", 1)[-1],
+            "caminho": r.name,
+            "ms": round(r.elapsed_ms, 2),
+            "db_ms": round(r.db_ms, 2) if ENABLED else None,
+            "db_chamadas": r.db_calls if ENABLED else None,
+        }
+        for r in _sections()
+    ]
+    return pd.DataFrame(rows, columns=["seção", "caminho", "ms", "db_ms", "db_chamadas"])
+
+
+def rerun_elapsed_ms() -> float:
+    """Tempo desde start_rerun() na thread atual."""
+    t0 = getattr(_local, "rerun_t0", None)
+    return 0.0 if t0 is None else (time.perf_counter() - t0) * 1000
+
+
+def finish_rerun() -> None:
+    """Registra no log o detalhamento do rerun por seção de nível superior."""
+    if os.environ.get("FINANCE_APP_PROFILE", "").strip() in ("1", "true", "True"):
+        level = logging.INFO
+        if not app_logger.handlers:
+            # Sem configuração de logging no processo: manda para o stderr
+            app_logger.addHandler(logging.StreamHandler())
+            app_logger.setLevel(logging.INFO)
+    else:
+        level = logging.DEBUG
+    if not app_logger.isEnabledFor(level):
+        return
+    top = [r for r in _sections() if r.depth == 0]
+    app_logger.log(
+        level,
+        "rerun %.1f ms: %s",
+        rerun_elapsed_ms(),
+        ", ".join(f"{r.name}={r.elapsed_ms:.1f}ms" for r in top),
+    )
+
+
+def rerun_calls() -> pd.DataFrame:
+    """Chamadas ao `db` feitas na thread atual desde start_rerun()."""
+    rows = [
+        {
+            "função": ("  " * r.depth) + r.function,
+            "ms": round(r.elapsed_ms, 2),
+            "linhas": r.rows,
+            "sql": len(r.statements),
+            "usuário": r.user_id,
+            "filtros": r.filters,
+        }
+        for r in _calls()
+    ]
+    return pd.DataFrame(rows, columns=["função", "ms", "linhas", "sql", "usuário", "filtros"])
+
+
+def rerun_totals() -> dict:
+    """Contagem e tempo total das chamadas de nível superior do rerun."""
+    top = [r for r in _calls() if r.depth == 0]
+    return {
+        "chamadas": len(top),
+        "instrucoes_sql": sum(len(r.statements) for r in _calls()),
+        "ms": round(sum(r.elapsed_ms for r in top), 2),
+    }
@@ -0,0 +1,111 @@
+"""Comandos de manutenção do banco (`python manage.py <comando>`)."""
+import argparse
+
+import db
+
+
+def cmd_check_plans(args: argparse.Namespace) -> None:
+    conn = db.get_connection()
+    try:
+        plans = db.check_query_plans(conn)
+    except db.QueryPlanError as exc:
+        raise SystemExit(f"FALHA: {exc}")
+    for name, plan in plans.items():
+        print(f"{name}: {' | '.join(plan)}")
+    print("OK: todas as consultas usam busca por intervalo nos índices.")
+
+
+def cmd_rebuild_rollup(args: argparse.Namespace) -> None:
+    conn = db.get_connection()
+    print(f"resumo_mensal recalculado: {db.rebuild_rollup(conn)} linhas.")
+
+
+def cmd_check_rollup(args: argparse.Namespace) -> None:
+    conn = db.get_connection()
+    diff = db.check_rollup(conn)
+    if diff.empty:
+        print("OK: resumo_mensal consistente com transacoes.")
+        return
+    print(diff.to_string(index=False))
+    raise SystemExit(f"{len(diff)} linhas divergentes; rode `python manage.py rebuild-rollup`.")
+
+
+def cmd_backfill_fingerprints(args: argparse.Namespace) -> None:
+    conn = db.get_connection()
+    n = db.backfill_fingerprints(conn)
+    print(f"{n} lançamentos antigos receberam impressão digital (detecção de reimportação).")
+
+
+def cmd_split_shards(args: argparse.Namespace) -> None:
+    if not db.SHARDS_DIRS:
+        raise SystemExit("Defina FINANCE_SHARDS_DIR com a(s) pasta(s) dos arquivos por usuário.")
+    conn = db.get_connection()
+    try:
+        copied = db.split_into_shards(conn, args.user or None)
+    except RuntimeError as exc:
+        raise SystemExit(str(exc))
+    for uid, n in copied.items():
+        print(f"{uid}: {n} lançamentos -> {db.shard_path(uid)}")
+    print(f"O banco compartilhado ({db.DB_PATH.name}) não foi alterado; mantenha-o como backup.")
+
+
+def cmd_import(args: argparse.Namespace) -> None:
+    conn = db.get_connection(args.user)
+    rep = db.import_csv_stream(conn, args.file, args.user, chunk_rows=args.chunk_rows)
+    if rep.resumed_from:
+        print(f"Retomando: {rep.resumed_from} linhas já tinham sido gravadas.")
+    print(f"{rep.inserted} inseridas, {rep.duplicates} já existentes, {rep.rejected_count} recusadas.")
+    if not rep.rejected.empty:
+        print(rep.rejected.head(20).to_string())
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    conn = db.get_connection(args.user)
+    if args.out.endswith((".parquet", ".arrows")):
+        fmt = "parquet" if args.out.endswith(".parquet") else "arrow"
+        rows = db.export_transactions_columnar(conn, args.out, fmt, user_id=args.user)
+        print(f"{args.out}: {rows} linhas.")
+        return
+    compress = args.out.endswith(".gz")
+    with open(args.out, "wb") as dest:
+        written = db.export_transactions_csv(conn, dest, user_id=args.user, compress=compress)
+    print(f"{args.out}: {written} bytes.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manutenção do banco do Controle Financeiro")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("check-plans", help="Verifica (EXPLAIN QUERY PLAN) o uso do índice (user_id, data)")
+    p.set_defaults(func=cmd_check_plans)
+
+    p = sub.add_parser("rebuild-rollup", help="Recalcula o resumo mensal a partir das transações")
+    p.set_defaults(func=cmd_rebuild_rollup)
+
+    p = sub.add_parser("check-rollup", help="Compara o resumo mensal com a agregação das transações")
+    p.set_defaults(func=cmd_check_rollup)
+
+    p = sub.add_parser("backfill-fingerprints", help="Calcula a impressão digital de lançamentos antigos para detectar reimportações")
+    p.set_defaults(func=cmd_backfill_fingerprints)
+
+    p = sub.add_parser("split-shards", help="Copia cada usuário do banco compartilhado para o seu arquivo (FINANCE_SHARDS_DIR)")
+    p.add_argument("--user", action="append", help="Só estes usuários (repetível); padrão: todos")
+    p.set_defaults(func=cmd_split_shards)
+
+    p = sub.add_parser("import", help="Importa um CSV grande em blocos; se interrompido, rodar de novo continua de onde parou")
+    p.add_argument("--user", required=True)
+    p.add_argument("--file", required=True)
+    p.add_argument("--chunk-rows", type=int, default=db.IMPORT_CHUNK_SIZE)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="Exporta os lançamentos de um usuário em streaming: CSV (.csv, .csv.gz), Parquet (.parquet) ou Arrow IPC (.arrows)")
+    p.add_argument("--user", required=True)
+    p.add_argument("--out", required=True)
+    p.set_defaults(func=cmd_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
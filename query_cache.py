@@ -0,0 +1,64 @@
+"""Cache de consultas por sessão do Streamlit.
+
+As leituras do `db` são guardadas em um dicionário da sessão
+(`st.session_state`), indexadas pelo nome da função e pelos argumentos
+(usuário + filtros). O cache é descartado quando a versão de dados do usuário
+(`db.get_data_version`) muda, o que acontece a cada `add_transaction` ou
+importação — inclusive quando a escrita vem de outra sessão do mesmo usuário.
+"""
+import sqlite3
+from collections.abc import MutableMapping
+from typing import Any, Callable, Optional
+
+import db
+
+MAX_ENTRIES = 32
+
+
+def _freeze(value: Any) -> Any:
+    # Transforma filtros (dicts/listas) em chaves hasheáveis
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class QueryCache:
+    def __init__(self, store: MutableMapping):
+        # `store` é persistente entre reruns (ex.: st.session_state["_query_cache"])
+        self.store = store
+        self.store.setdefault("entries", {})
+
+    def sync(self, conn: sqlite3.Connection, user_id: Optional[str]) -> None:
+        """Lê a versão de dados do usuário (uma consulta) e invalida se mudou."""
+        state = (user_id or "", db.get_data_version(conn, user_id))
+        if self.store.get("state") != state:
+            self.store["state"] = state
+            self.store["entries"] = {}
+
+    def invalidate(self) -> None:
+        self.store["state"] = None
+        self.store["entries"] = {}
+
+    def get(self, fn: Callable, *args, **kwargs) -> Any:
+        """Chama `fn(*args, **kwargs)` ou devolve o resultado guardado.
+
+        Conexões não entram na chave. O resultado é compartilhado entre
+        chamadas: não o modifique in-place.
+        """
+        key = (
+            getattr(fn, "__qualname__", repr(fn)),
+            _freeze([a for a in args if not isinstance(a, sqlite3.Connection)]),
+            _freeze(kwargs),
+        )
+        entries = self.store["entries"]
+        if key in entries:
+            # Reinsere para manter ordem de uso recente (LRU)
+            entries[key] = entries.pop(key)
+            return entries[key]
+        result = fn(*args, **kwargs)
+        entries[key] = result
+        while len(entries) > MAX_ENTRIES:
+            entries.pop(next(iter(entries)))
+        return result
@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Conexão de um banco novo (esquema completo) em um arquivo temporário."""
+    pool = db.ConnectionPool(tmp_path / "finance.db")
+    yield pool.get()
+    pool.close_all()
@@ -0,0 +1,81 @@
+import io
+
+import db
+
+CABECALHO = "data,tipo,categoria,subcategoria,descricao,valor,conta,tags\n"
+
+
+def _csv(linhas: list[str]) -> io.BytesIO:
+    return io.BytesIO((CABECALHO + "".join(l + "\n" for l in linhas)).encode())
+
+
+def test_rejection_reasons():
+    validas, recusadas, _ = db._coerce_import_frame(
+        db.pd.read_csv(_csv([
+            "2025-01-05,Despesa,,,sem nada,10,,",
+            "2025-01-05,Despesa,Moradia,,sem sub,10,,",
+            "2025-01-05,Despesa,Moradia,Aluguel,ok,10,,",
+        ]), dtype=str, keep_default_na=False)
+    )
+    assert list(recusadas["motivo"]) == ["subcategoria vazia", "subcategoria vazia"]
+    assert db._match_taxonomy("Despesa", "", "Inexistente")[2] == "categoria vazia"
+    assert len(validas) == 1
+
+
+def _extrato(n: int) -> list[str]:
+    # Duas linhas idênticas no início: a ordem entre elas entra na impressão digital
+    linhas = ["2025-01-05,Despesa,Alimentação,Supermercado,Mercado,10,Nubank,#mercado"] * 2
+    linhas += [f"2025-01-{6 + i % 20:02d},Despesa,Moradia,Aluguel,linha {i},{i + 1},Nubank," for i in range(n)]
+    return linhas
+
+
+def _ler(linhas: list[str]):
+    return db.pd.read_csv(_csv(linhas), dtype=str, keep_default_na=False)
+
+
+def test_reimport_skips_existing_rows(conn):
+    primeira = db.bulk_insert_transactions(conn, _ler(_extrato(10)), "u1")
+    assert (primeira.inserted, primeira.duplicates) == (12, 0)
+
+    # Extrato sobreposto: as mesmas 12 linhas e uma nova
+    extra = "2025-02-01,Despesa,Moradia,Aluguel,nova,99,Nubank,"
+    segunda = db.bulk_insert_transactions(conn, _ler(_extrato(10) + [extra]), "u1")
+    assert (segunda.inserted, segunda.duplicates) == (1, 12)
+    # Outro usuário com o mesmo extrato não é duplicata
+    assert db.bulk_insert_transactions(conn, _ler(_extrato(10)), "u2").inserted == 12
+
+
+def test_stream_import_resumes_after_interruption(conn, tmp_path, monkeypatch):
+    linhas = _extrato(40)
+    original = db._insert_valid
+    chamadas = []
+
+    def falha_no_terceiro_bloco(*args, **kwargs):
+        chamadas.append(1)
+        if len(chamadas) == 3:
+            raise RuntimeError("interrompido")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(db, "_insert_valid", falha_no_terceiro_bloco)
+    try:
+        db.import_csv_stream(conn, _csv(linhas), "u1", chunk_rows=10)
+    except RuntimeError:
+        pass
+    monkeypatch.setattr(db, "_insert_valid", original)
+
+    retomada = db.import_csv_stream(conn, _csv(linhas), "u1", chunk_rows=10)
+    assert retomada.resumed_from == 20
+    assert retomada.inserted == len(linhas) - 20
+    assert db.count_transactions(conn, "u1") == len(linhas)
+    # Mesmas impressões que a importação do arquivo inteiro de uma vez
+    pool = db.ConnectionPool(tmp_path / "inteiro.db")
+    inteiro = pool.get()
+    db.bulk_insert_transactions(inteiro, _ler(linhas), "u1")
+    impressoes = "SELECT impressao FROM transacoes ORDER BY impressao"
+    assert conn.execute(impressoes).fetchall() == inteiro.execute(impressoes).fetchall()
+    pool.close_all()
+
+    # Arquivo concluído: nada é relido nem gravado
+    de_novo = db.import_csv_stream(conn, _csv(linhas), "u1", chunk_rows=10)
+    assert de_novo.inserted == 0 and de_novo.resumed_from == len(linhas)
+    assert db.check_rollup(conn).empty
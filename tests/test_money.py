@@ -0,0 +1,58 @@
+import io
+import sqlite3
+from datetime import date
+
+import pandas as pd
+
+import db
+
+VALORES = [1.005, 2.675, 0.125, 0.015, 19.99, 1234.565]
+
+
+def test_import_and_manual_paths_store_same_cents(conn):
+    for v in VALORES:
+        db.add_transaction(conn, date(2025, 3, 1), "Despesa", "Moradia", "Aluguel", "manual", v, "", "", "u1")
+    # CSV no formato brasileiro (vírgula decimal), como os extratos
+    csv = "data;tipo;categoria;subcategoria;descricao;valor;conta;tags\n" + "".join(
+        f"2025-03-02;Despesa;Moradia;Aluguel;csv {i};{str(v).replace('.', ',')};;\n" for i, v in enumerate(VALORES)
+    )
+    db.import_csv_stream(conn, io.BytesIO(csv.encode()), "u1")
+    db.bulk_insert_transactions(
+        conn, pd.DataFrame({"data": "2025-03-03", "tipo": "Despesa", "categoria": "Moradia",
+                            "subcategoria": "Aluguel", "descricao": [f"df {i}" for i in range(len(VALORES))],
+                            "valor": VALORES, "conta": "", "tags": ""}), "u1",
+    )
+    esperado = [db.to_cents(v) for v in VALORES]
+    assert esperado == [101, 268, 13, 2, 1999, 123457]
+    for data in ("2025-03-01", "2025-03-02", "2025-03-03"):
+        rows = conn.execute("SELECT valor_centavos FROM transacoes WHERE data = ? ORDER BY id", (data,)).fetchall()
+        assert [r[0] for r in rows] == esperado
+
+
+def test_legacy_real_column_is_dropped(tmp_path):
+    path = tmp_path / "v8.db"
+    legado = sqlite3.connect(path)
+    legado.execute(
+        """
+        CREATE TABLE transacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, categoria_id INTEGER NOT NULL,
+            descricao TEXT, valor REAL NOT NULL, conta TEXT, tags TEXT, user_id TEXT,
+            valor_centavos INTEGER, impressao INTEGER
+        )
+        """
+    )
+    legado.executemany(
+        "INSERT INTO transacoes (data, categoria_id, descricao, valor, valor_centavos, user_id) VALUES (?, 1, 'x', ?, ?, 'u1')",
+        [("2025-01-05", 1.005, None), ("2025-01-06", 3.5, 350)],
+    )
+    legado.execute("PRAGMA user_version = 8")
+    legado.commit()
+    legado.close()
+
+    pool = db.ConnectionPool(path)
+    conn = pool.get()
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(transacoes)")]
+    assert "valor" not in cols
+    assert [r[0] for r in conn.execute("SELECT valor_centavos FROM transacoes ORDER BY id")] == [101, 350]
+    assert db.check_rollup(conn).empty
+    pool.close_all()
@@ -0,0 +1,27 @@
+from datetime import date
+
+import db
+
+
+def test_keyset_pages_match_full_listing(conn):
+    # Vários lançamentos no mesmo dia: o id desempata a ordem
+    for i in range(125):
+        db.add_transaction(conn, date(2025, 1, 1 + i % 7), "Despesa", "Moradia", "Aluguel", f"l{i}", 1 + i, "", "", "u1")
+    db.add_transaction(conn, date(2025, 1, 3), "Despesa", "Moradia", "Aluguel", "outro", 1, "", "", "u2")
+    completa = db.get_transactions(conn, "u1")
+    esperado = completa.sort_values(["data", "id"], ascending=False)["id"].tolist()
+
+    paginas, after = [], None
+    while True:
+        pagina = db.get_transactions_page(conn, "u1", page_size=20, after=after)
+        if pagina.empty:
+            break
+        paginas.append(pagina)
+        after = db.page_cursor(pagina.iloc[-1])
+    assert [i for p in paginas for i in p["id"]] == esperado
+    assert [len(p) for p in paginas] == [20] * 6 + [5]
+
+    # `before` volta para a página anterior, na mesma ordem
+    anterior = db.get_transactions_page(conn, "u1", page_size=20, before=db.page_cursor(paginas[3].iloc[0]))
+    assert anterior["id"].tolist() == paginas[2]["id"].tolist()
+    assert db.count_transactions(conn, "u1") == 125
@@ -0,0 +1,35 @@
+from datetime import date
+
+import pytest
+
+import db
+
+
+def test_all_queries_use_index_range_search(conn):
+    plans = db.check_query_plans(conn)
+    assert "get_transactions" in plans and "get_monthly_trends" in plans
+    for nome in (
+        "count_transactions (busca e tag)", "get_dashboard_snapshot (busca e tag)",
+        "get_month_category_totals", "get_transactions_page (tag)",
+    ):
+        assert nome in plans
+
+
+def test_plans_hold_with_data(conn):
+    for i in range(400):
+        db.add_transaction(
+            conn, date(2024, 1 + i % 12, 1 + i % 28), "Despesa", "Moradia", "Aluguel",
+            f"d{i}", 10 + i, "", "#casa", f"u{i % 8}" if i % 2 else "plan-check",
+        )
+    conn.execute("ANALYZE")
+    db.check_query_plans(conn)
+
+
+def test_full_scan_is_reported(conn, monkeypatch):
+    # Filtro sobre date(data) impede o uso do índice (user_id, data)
+    monkeypatch.setattr(
+        db, "_spend_by_tag_query",
+        lambda *a: ("SELECT id FROM transacoes WHERE user_id = ? AND date(data) >= ?", ["plan-check", "2024-01-01"]),
+    )
+    with pytest.raises(db.QueryPlanError, match="get_spend_by_tag"):
+        db.check_query_plans(conn)
@@ -0,0 +1,29 @@
+from datetime import date
+
+import pandas as pd
+
+import db
+
+
+def test_moving_averages_start_at_first_month(conn):
+    # Primeiro lançamento em março; maio sem lançamentos (conta como zero)
+    for mes, valor in [(3, 100), (4, 200), (6, 300), (7, 400)]:
+        db.add_transaction(conn, date(2025, mes, 5), "Despesa", "Moradia", "Aluguel", "", valor, "", "", "u1")
+        db.add_transaction(conn, date(2025, mes, 6), "Receita", "Salário", "Salário", "", 1000, "", "", "u1")
+    df = db.get_monthly_trends(conn, "u1", date(2025, 1, 1), date(2025, 8, 31)).set_index("ym")
+
+    assert df.loc[["2025-01", "2025-02"], ["despesas_mm3", "despesas_mm12", "saldo_mm3"]].isna().all().all()
+    serie = df.loc["2025-03":, "despesas"]
+    for n in (3, 6, 12):
+        esperado = serie.rolling(n, min_periods=1).mean()
+        pd.testing.assert_series_equal(df.loc["2025-03":, f"despesas_mm{n}"], esperado, check_names=False)
+    assert df.loc["2025-08", "saldo_acumulado"] == 4000 - 1000
+
+
+def test_category_yoy(conn):
+    db.add_transaction(conn, date(2024, 2, 1), "Despesa", "Moradia", "Aluguel", "", 100, "", "", "u1")
+    db.add_transaction(conn, date(2025, 2, 1), "Despesa", "Moradia", "Aluguel", "", 150, "", "", "u1")
+    df = db.get_category_yoy(conn, "u1", date(2025, 1, 1), date(2025, 3, 31))
+    linha = df[df["categoria"] == "Moradia"].iloc[0]
+    assert (linha["valor"], linha["valor_ano_anterior"]) == (150, 100)
+    assert abs(linha["variacao"] - 0.5) < 1e-9
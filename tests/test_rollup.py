@@ -0,0 +1,42 @@
+from datetime import date
+
+import pandas as pd
+
+import db
+
+
+def _lancar(conn, dia, tipo, categoria, subcategoria, valor, user_id="u1"):
+    return db.add_transaction(conn, dia, tipo, categoria, subcategoria, "", valor, "", "", user_id)
+
+
+def test_rollup_follows_inserts_updates_and_deletes(conn):
+    ids = [
+        _lancar(conn, date(2025, 1, 10), "Despesa", "Moradia", "Aluguel", 1500),
+        _lancar(conn, date(2025, 1, 20), "Despesa", "Alimentação", "Supermercado", 320.45),
+        _lancar(conn, date(2025, 2, 3), "Receita", "Salário", "Salário", 5000),
+        _lancar(conn, date(2025, 2, 3), "Despesa", "Moradia", "Aluguel", 1500, user_id="u2"),
+    ]
+    assert all(isinstance(i, int) for i in ids)
+    with conn:
+        conn.execute("UPDATE transacoes SET valor_centavos = 200000 WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE transacoes SET data = '2025-03-01' WHERE id = ?", (ids[1],))
+        conn.execute("DELETE FROM transacoes WHERE id = ?", (ids[2],))
+    assert db.check_rollup(conn).empty
+
+    # Meses inteiros vêm do resumo, as pontas parciais das transações
+    inicio, fim = date(2025, 1, 15), date(2025, 3, 31)
+    fluxo = db.get_monthly_breakdown(conn, inicio, fim, "u1").set_index("ym")
+    cru = db.get_transactions(conn, "u1", data_inicio=inicio, data_fim=fim)
+    cru["ym"] = pd.to_datetime(cru["data"]).dt.strftime("%Y-%m")
+    despesas = cru[cru["tipo"] == "Despesa"].groupby("ym")["valor"].sum()
+    assert despesas.to_dict() == {"2025-03": 320.45}
+    assert fluxo["despesas"][fluxo["despesas"] != 0].to_dict() == despesas.to_dict()
+    assert fluxo["receitas"].sum() == 0
+
+def test_rebuild_matches_triggers(conn):
+    for i in range(30):
+        _lancar(conn, date(2024, 1 + i % 12, 1 + i % 27), "Despesa", "Moradia", "Aluguel", 10 + i)
+    antes = pd.read_sql_query("SELECT * FROM resumo_mensal ORDER BY 1, 2, 3", conn)
+    db.rebuild_rollup(conn)
+    depois = pd.read_sql_query("SELECT * FROM resumo_mensal ORDER BY 1, 2, 3", conn)
+    pd.testing.assert_frame_equal(antes, depois)
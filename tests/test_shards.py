@@ -0,0 +1,52 @@
+from datetime import date
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "SHARDS_DIRS", [tmp_path / "shards"])
+    monkeypatch.setattr(db, "_SHARD_POOLS", {})
+    yield
+    for pool in db._SHARD_POOLS.values():
+        pool.close_all()
+
+
+def _lancar(conn, descricao, tags, user_id):
+    db.add_transaction(conn, date(2025, 1, 5), "Despesa", "Moradia", "Aluguel", descricao, 10, "", tags, user_id)
+
+
+def test_split_copies_rows_and_tags(conn, shards):
+    for i in range(3):
+        _lancar(conn, f"alice {i}", f"#t{i}", "alice")
+    _lancar(conn, "bob", "#b", "bob")
+    assert db.split_into_shards(conn) == {"alice": 3, "bob": 1}
+    alice = db.get_connection("alice")
+    pares = alice.execute(
+        "SELECT t.descricao, g.tag FROM transacoes t JOIN transacao_tags g ON g.transacao_id = t.id ORDER BY 1"
+    ).fetchall()
+    assert [tuple(p) for p in pares] == [("alice 0", "t0"), ("alice 1", "t1"), ("alice 2", "t2")]
+    assert db.check_rollup(alice).empty
+
+
+def test_split_refuses_non_empty_shard(conn, shards):
+    for i in range(3):
+        _lancar(conn, f"shared {i}", f"#t{i}", "alice")
+    _lancar(db.get_connection("alice"), "new in shard", "", "alice")
+    with pytest.raises(RuntimeError, match="alice"):
+        db.split_into_shards(conn)
+    assert db.count_transactions(db.get_connection("alice"), "alice") == 1
+
+
+def test_split_keeps_open_pools_under_the_cap(conn, shards, monkeypatch):
+    monkeypatch.setattr(db, "MAX_OPEN_SHARDS", 4)
+    usuarios = [f"user{i:02d}" for i in range(12)]
+    for uid in usuarios:
+        _lancar(conn, uid, "#x", uid)
+    copiados = db.split_into_shards(conn)
+    assert copiados == {uid: 1 for uid in usuarios}
+    assert len(db._SHARD_POOLS) <= db.MAX_OPEN_SHARDS
+    # Nenhum arquivo fica preso à thread que fez a divisão
+    assert all(not pool._owners for pool in db._SHARD_POOLS.values())
@@ -0,0 +1,51 @@
+from datetime import date
+
+import db
+
+
+def _lancar(conn, dia, valor, tags, tipo="Despesa", user_id="u1"):
+    categoria, sub = ("Moradia", "Aluguel") if tipo == "Despesa" else ("Salário", "Salário")
+    return db.add_transaction(conn, dia, tipo, categoria, sub, "", valor, "", tags, user_id)
+
+
+def test_tag_filter_requires_every_tag(conn):
+    ambos = _lancar(conn, date(2025, 1, 5), 10, "#lazer #trabalho")
+    _lancar(conn, date(2025, 1, 6), 20, "#Lazer")
+    _lancar(conn, date(2025, 1, 7), 30, "#trabalho")
+    _lancar(conn, date(2025, 1, 8), 40, "#lazer", user_id="u2")
+
+    assert db.count_transactions(conn, "u1", tag="#lazer") == 2
+    assert db.get_transactions(conn, "u1", tag="#lazer #trabalho")["id"].tolist() == [ambos]
+    pagina = db.get_transactions_page(conn, "u1", tag="lazer, trabalho")
+    assert pagina["id"].tolist() == [ambos]
+    assert db.count_transactions(conn, "u1", tag="#viagem") == 0
+
+
+def test_tags_follow_updates_of_the_text(conn):
+    tid = _lancar(conn, date(2025, 1, 5), 10, "#mercado #casa")
+    with conn:
+        conn.execute("UPDATE transacoes SET tags = '#Viagem, #casa' WHERE id = ?", (tid,))
+    tags = [r[0] for r in conn.execute("SELECT tag FROM transacao_tags WHERE transacao_id = ? ORDER BY 1", (tid,))]
+    assert tags == ["casa", "viagem"]
+    assert db.count_transactions(conn, "u1", tag="#mercado") == 0
+    with conn:
+        conn.execute("DELETE FROM transacoes WHERE id = ?", (tid,))
+    assert conn.execute("SELECT COUNT(*) FROM transacao_tags").fetchone()[0] == 0
+
+
+def test_spend_by_tag(conn):
+    _lancar(conn, date(2025, 1, 5), 10.5, "#casa #fixo")
+    _lancar(conn, date(2025, 1, 20), 4.5, "#casa")
+    _lancar(conn, date(2025, 2, 1), 7, "#casa")
+    _lancar(conn, date(2025, 1, 9), 1000, "#casa", tipo="Receita")
+    _lancar(conn, date(2025, 1, 9), 99, "#casa", user_id="u2")
+
+    df = db.get_spend_by_tag(conn, "u1", date(2025, 1, 1), date(2025, 2, 28))
+    linhas = {(r.ym, r.tag): (r.valor, r.qtd) for r in df.itertuples()}
+    assert linhas == {
+        ("2025-01", "casa"): (15.0, 2),
+        ("2025-01", "fixo"): (10.5, 1),
+        ("2025-02", "casa"): (7.0, 1),
+    }
+    receitas = db.get_spend_by_tag(conn, "u1", date(2025, 1, 1), date(2025, 1, 31), tipo="Receita")
+    assert receitas[["tag", "valor"]].values.tolist() == [["casa", 1000.0]]
@@ -0,0 +1,98 @@
+"""Fila de escrita dos lançamentos manuais.
+
+Cada banco (o compartilhado ou o arquivo de um usuário, no modo
+FINANCE_SHARDS_DIR) tem uma única thread escritora. As sessões do Streamlit
+enfileiram o lançamento e recebem um `Future`; a escritora junta o que chegou
+em lotes pequenos e grava cada lote com um só commit (`db.add_transactions`).
+Assim as sessões não disputam o lock de escrita do SQLite entre si, e o tempo
+de salvar não cresce com o número de sessões salvando ao mesmo tempo.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import db
+
+# Lançamentos por commit (máximo). Não há espera para completar o lote: ele
+# leva o que chegou enquanto o commit anterior era gravado
+BATCH_MAX = 64
+# A thread escritora termina após este tempo (s) sem trabalho; volta no próximo envio
+IDLE_EXIT = 30.0
+
+
+class WriteQueue:
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        # `connect` devolve a conexão do pool para a thread atual (a escritora)
+        self.connect = connect
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, **row) -> Future:
+        """Enfileira um lançamento (argumentos de db.add_transaction, sem `conn`).
+
+        O Future termina com o id gravado, ou com a exceção da gravação.
+        """
+        fut: Future = Future()
+        with self._lock:
+            self._queue.put((row, fut))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="finance-writer", daemon=True)
+                self._thread.start()
+        return fut
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=IDLE_EXIT)]
+        except queue.Empty:
+            return []
+        while len(batch) < BATCH_MAX:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        conn = None
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                with self._lock:
+                    # Só sai se nada chegou entre o timeout e o lock
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                conn = conn or self.connect()
+                results = db.add_transactions(conn, [row for row, _ in batch])
+            except Exception as exc:
+                # Falha do lote inteiro (ex.: banco travado além do busy_timeout)
+                results = [exc] * len(batch)
+            for (_, fut), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+
+_WRITERS: dict[str, WriteQueue] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_writer(user_id: Optional[str] = None) -> WriteQueue:
+    """Fila do banco onde os lançamentos de `user_id` são gravados."""
+    key = str(db.shard_path(user_id) if db.SHARDS_DIRS and user_id else db.DB_PATH)
+    with _WRITERS_LOCK:
+        w = _WRITERS.get(key)
+        if w is None:
+            w = _WRITERS[key] = WriteQueue(lambda: db.get_connection(user_id))
+        return w
+
+
+def add_transaction(user_id: Optional[str] = None, **row) -> Future:
+    """Enfileira um lançamento na fila do banco do usuário; ver WriteQueue.submit."""
+    return get_writer(user_id).submit(user_id=user_id, **row)